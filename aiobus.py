@@ -0,0 +1,143 @@
+"""
+An asyncio scheduler for sharing one I2CDriver Mini (https://i2cdriver.com/mini.html)
+between several devices
+"""
+
+import asyncio
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+import i2cdriver
+import i2cstats
+from counter import HT16K33
+from mcp9808 import MCP9808
+from tsl2561 import TSL2561
+
+
+class BusScheduler:
+    """
+    Owns the bus and runs every operation on it, one at a time, in a single
+    worker thread, so the event loop never blocks on I2C traffic. Operations are
+    queued by priority (lower numbers first) and then in arrival order. An
+    operation with a deadline that cannot be started by then is abandoned and
+    its caller gets an asyncio.TimeoutError, so a backlog sheds stale work
+    rather than running late
+    """
+
+    PRIORITY_HIGH = 0
+    PRIORITY_NORMAL = 5
+    PRIORITY_LOW = 10
+
+    def __init__(self, i2c):
+        self.i2c = i2c
+        self.completed = 0
+        self.expired = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="i2c")
+        self._order = itertools.count()
+        self._queue = None
+        self._tasks = []
+
+    async def start(self):
+        self._queue = asyncio.PriorityQueue()
+        self._tasks.append(asyncio.create_task(self._dispatch()))
+        return self
+
+    async def close(self):
+        for task in self._tasks: task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._executor.shutdown(wait=True)
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def run(self, func, *args, priority=PRIORITY_NORMAL, deadline=None):
+        """
+        Queue func(*args), which may use the bus, and return its result. 'deadline'
+        is the number of seconds from now by which it must have started
+        """
+        loop = asyncio.get_running_loop()
+        due = loop.time() + deadline if deadline is not None else None
+        future = loop.create_future()
+        await self._queue.put((priority, next(self._order), due, func, args, future))
+        return await future
+
+    async def read(self, func, *args, priority=PRIORITY_NORMAL, deadline=None):
+        """
+        Run a driver read method, eg. sensor.get_temperature, and return its value
+        """
+        return await self.run(func, *args, priority=priority, deadline=deadline)
+
+    async def update(self, display, priority=PRIORITY_HIGH, deadline=None):
+        """
+        Send a display's buffer
+        """
+        return await self.run(display.update, priority=priority, deadline=deadline)
+
+    def every(self, period, func, *args, callback=None, priority=PRIORITY_NORMAL):
+        """
+        Run func(*args) every 'period' seconds, passing each result to 'callback'
+        if one is given. A run that cannot start within its period is skipped
+        """
+        async def repeat():
+            loop = asyncio.get_running_loop()
+            due = loop.time()
+            while True:
+                try:
+                    result = await self.run(func, *args, priority=priority, deadline=period)
+                    if callback is not None: callback(result)
+                except asyncio.TimeoutError:
+                    pass
+                due = max(due + period, loop.time())
+                await asyncio.sleep(due - loop.time())
+
+        task = asyncio.create_task(repeat())
+        self._tasks.append(task)
+        return task
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            priority, order, due, func, args, future = await self._queue.get()
+            if future.done(): continue
+            if due is not None and loop.time() > due:
+                self.expired += 1
+                future.set_exception(asyncio.TimeoutError())
+                continue
+            try:
+                result = await loop.run_in_executor(self._executor, func, *args)
+            except Exception as err:
+                if not future.done(): future.set_exception(err)
+            else:
+                if not future.done(): future.set_result(result)
+            self.completed += 1
+
+
+async def main(i2c):
+    async with BusScheduler(i2c) as bus:
+        # Construct the drivers on the bus thread too
+        sensor = await bus.run(MCP9808, i2c)
+        light = await bus.run(TSL2561, i2c)
+        led = await bus.run(HT16K33, i2c)
+        state = {"temp": 0.0}
+
+        def show_temperature(reading):
+            state["temp"] = reading
+            led.set_value(reading, decimals=1)
+            print(f"Temperature: {reading:.2f}ºC")
+
+        def show_light(reading):
+            print(f"Light: {reading[0]}, {reading[1]}")
+
+        bus.every(5.0, sensor.get_temperature, callback=show_temperature)
+        bus.every(1.0, light.get_light_level, callback=show_light, priority=bus.PRIORITY_LOW)
+        bus.every(1 / 30, led.update, priority=bus.PRIORITY_HIGH)
+        await asyncio.Event().wait()
+
+
+if __name__ == '__main__':
+    # Set I2C_STATS=text or I2C_STATS=json to report bus usage
+    i2c_bus = i2cstats.from_env(i2cdriver.I2CDriver("/dev/cu.usbserial-DO029IEZ"))
+    asyncio.run(main(i2c_bus))
@@ -0,0 +1,246 @@
+"""
+Benchmarks for the drivers' hot paths, run against simulated buses rather than
+an I2CDriver Mini (https://i2cdriver.com/mini.html)
+
+Usage: python3 bench.py [--frames N] [--output FILE] [--baseline FILE] [--tolerance PERCENT]
+"""
+
+import sys
+import json
+import time
+import struct
+import argparse
+from fakebus import FakeI2CDriver
+from matrix import HT16K33 as MatrixLED
+from counter import HT16K33 as SegmentLED
+from mcp9808 import MCP9808
+from tsl2561 import TSL2561
+
+
+class CountingBus:
+    """
+    A bus that does nothing but count transactions and I2C bytes (including
+    address bytes), so the time spent in it barely registers against the drivers'
+    """
+
+    def __init__(self):
+        self.transactions = 0
+        self.bytes = 0
+
+    def start(self, dev, rw):
+        self.transactions += 1
+        self.bytes += 1
+        return True
+
+    def write(self, bb):
+        self.bytes += len(bb)
+        return True
+
+    def read(self, l):
+        self.bytes += l
+        return bytes(l)
+
+    def stop(self):
+        pass
+
+    def regrd(self, dev, reg, fmt="B"):
+        self.transactions += 1
+        if isinstance(fmt, str):
+            self.bytes += struct.calcsize(fmt) + 3
+            r = struct.unpack(fmt, bytes(struct.calcsize(fmt)))
+            return r[0] if len(r) == 1 else r
+        self.bytes += fmt + 3
+        return bytes(fmt)
+
+    def regwr(self, dev, reg, vv):
+        self.transactions += 1
+        self.bytes += (1 if isinstance(vv, int) else len(vv)) + 2
+        return True
+
+    def scan(self, silent=False):
+        return []
+
+
+# Each workload takes a bus and a frame (or sample) count, runs that many
+# frames and returns how many it actually ran
+
+def matrix_plot(i2c, count):
+    led = MatrixLED(i2c)
+    for n in range(0, count):
+        led.clear().plot(n % 16, (n >> 4) & 7).update()
+    return count
+
+
+def matrix_set_char(i2c, count):
+    led = MatrixLED(i2c)
+    for n in range(0, count):
+        led.clear().set_char(chr(33 + n % 94), n % 12).update()
+    return count
+
+
+def matrix_scroll_text(i2c, count):
+    led = MatrixLED(i2c)
+    done = 0
+    while done < count:
+        done += led.scroll_text("The quick brown fox jumps over the lazy dog", speed=0)["frames"]
+    return done
+
+
+def matrix_scroll_stream(i2c, count):
+    led = MatrixLED(i2c)
+    done = 0
+    while done < count:
+        done += led.scroll_stream("The quick brown fox jumps over the lazy dog", speed=0)["frames"]
+    return done
+
+
+def matrix_dashboard(i2c, count):
+    # A small dashboard: a frame, a moving bar and a marker sprite
+    led = MatrixLED(i2c)
+    for n in range(0, count):
+        level = n % 14
+        led.clear().rect(0, 0, 16, 8)
+        led.rect(1, 1, level + 1, 3, fill=True)
+        led.line(1, 6, 1 + level, 5)
+        led.sprite(n % 12, 4, b"\x03\x03")
+        led.update()
+    return count
+
+
+def segment_set_number(i2c, count):
+    led = SegmentLED(i2c)
+    for n in range(0, count):
+        bcd = int(str(n % 10000), 16)
+        led.set_number((bcd & 0xF000) >> 12, 0)
+        led.set_number((bcd & 0x0F00) >> 8, 1)
+        led.set_number((bcd & 0xF0) >> 4, 2)
+        led.set_number((bcd & 0x0F), 3)
+        led.update()
+    return count
+
+
+def segment_set_value(i2c, count):
+    # Count up and back down again, as counter.py does
+    led = SegmentLED(i2c)
+    for n in range(0, count):
+        led.set_value(min(n, count - 1 - n) % 10000, leading_zeros=True)
+        led.update()
+    return count
+
+
+def mcp9808_get_temperature(i2c, count):
+    sensor = MCP9808(i2c)
+    for n in range(0, count):
+        sensor.get_temperature()
+    return count
+
+
+def tsl2561_get_light_level(i2c, count):
+    sensor = TSL2561(i2c)
+    for n in range(0, count):
+        sensor.get_light_level()
+    return count
+
+
+def tsl2561_get_lux(i2c, count):
+    sensor = TSL2561(i2c)
+    for n in range(0, count):
+        sensor.get_lux()
+    return count
+
+
+WORKLOADS = {
+    "matrix.plot": (matrix_plot, 1),
+    "matrix.set_char": (matrix_set_char, 1),
+    "matrix.scroll_text": (matrix_scroll_text, 1),
+    "matrix.scroll_stream": (matrix_scroll_stream, 1),
+    "matrix.dashboard": (matrix_dashboard, 1),
+    "segment.set_number": (segment_set_number, 1),
+    "segment.set_value": (segment_set_value, 1),
+    "mcp9808.get_temperature": (mcp9808_get_temperature, 4),
+    "tsl2561.get_light_level": (tsl2561_get_light_level, 4),
+    "tsl2561.get_lux": (tsl2561_get_lux, 4),
+}
+
+# Whether a larger value of each metric is an improvement
+HIGHER_IS_BETTER = {"cpu_us": False, "bytes": False, "transactions": False,
+                    "bus_us": False, "rate": True}
+
+
+def run_workload(func, count):
+    """
+    Time the workload's CPU cost on a counting bus, then its simulated bus time
+    on a FakeI2CDriver, and return the per-frame figures. The cost of setting
+    up the driver, measured with a zero-frame run, is taken off
+    """
+    bus = CountingBus()
+    begun = time.process_time()
+    func(bus, 0)
+    setup = time.process_time() - begun
+    setup_transactions, setup_bytes = bus.transactions, bus.bytes
+
+    bus = CountingBus()
+    begun = time.process_time()
+    done = func(bus, count)
+    cpu = max(time.process_time() - begun - setup, 0.0) / done
+    transactions = (bus.transactions - setup_transactions) / done
+    total = (bus.bytes - setup_bytes) / done
+
+    fake = FakeI2CDriver()
+    func(fake, 0)
+    setup = fake.elapsed
+    fake = FakeI2CDriver()
+    func(fake, count)
+    bus_time = (fake.elapsed - setup) / done
+
+    return {"cpu_us": cpu * 1e6,
+            "bytes": total,
+            "transactions": transactions,
+            "bus_us": bus_time * 1e6,
+            "rate": 1.0 / (cpu + bus_time)}
+
+
+def compare(results, baseline, tolerance):
+    """
+    Print each metric's change against the baseline and return the number that
+    got worse by more than 'tolerance' percent
+    """
+    regressions = 0
+    for name, metrics in results.items():
+        if name not in baseline: continue
+        for key, value in metrics.items():
+            old = baseline[name].get(key)
+            if not old: continue
+            change = (value - old) / old * 100
+            worse = -change if HIGHER_IS_BETTER[key] else change
+            flag = ""
+            if worse > tolerance:
+                flag = "  REGRESSION"
+                regressions += 1
+            print(f"{name:<26} {key:<13} {old:>12.2f} -> {value:>12.2f} ({change:+.1f}%){flag}",
+                  file=sys.stderr)
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the I2CDriver Mini demo drivers")
+    parser.add_argument("--frames", type=int, default=2000, help="display frames per workload")
+    parser.add_argument("--output", help="write the JSON results to this file")
+    parser.add_argument("--baseline", help="compare against a previous JSON results file")
+    parser.add_argument("--tolerance", type=float, default=10.0,
+                        help="percentage change allowed before a metric counts as a regression")
+    args = parser.parse_args()
+
+    results = {}
+    for name, (func, divisor) in WORKLOADS.items():
+        results[name] = run_workload(func, max(1, args.frames // divisor))
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f: f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f: baseline = json.load(f)
+        if compare(results, baseline, args.tolerance) > 0: sys.exit(1)
@@ -0,0 +1,260 @@
+"""
+A bus daemon for the I2CDriver Mini (https://i2cdriver.com/mini.html): one process
+holds the serial connection and serves any number of local clients over a Unix
+domain socket
+
+Usage: python3 busd.py [--socket PATH] [--port SERIAL_PORT]
+"""
+
+import os
+import socket
+import struct
+import asyncio
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import i2cdriver
+import i2cstats
+from i2cbatch import BatchError
+
+SOCKET_PATH = "/tmp/i2cdriver.sock"
+
+# Requests are a header followed by 'length' payload bytes for writes:
+#   op, sequence number, device address, register, length
+# Responses are a header followed by 'length' payload bytes for reads:
+#   status, sequence number, length
+REQUEST = struct.Struct("<BHBBH")
+RESPONSE = struct.Struct("<BHH")
+
+OP_REGRD = 1
+OP_REGWR = 2
+OP_WRITE = 3
+OP_READ = 4
+OP_SCAN = 5
+
+STATUS_OK = 0
+STATUS_NACK = 1
+STATUS_ERROR = 2
+
+
+class BusServer:
+    """
+    Serves an I2CDriver to clients connected to a Unix domain socket. Clients may
+    pipeline requests; each client's requests run in the order sent, and clients
+    with work waiting take turns, one request each, so a busy client cannot starve
+    the others. Bus operations run in a single worker thread
+    """
+
+    def __init__(self, i2c, path=SOCKET_PATH):
+        self.i2c = i2c
+        self.path = path
+        self.served = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="i2c")
+        self._queues = {}
+        self._ready = deque()
+        self._work = None
+
+    async def serve(self):
+        if os.path.exists(self.path): os.unlink(self.path)
+        self._work = asyncio.Event()
+        server = await asyncio.start_unix_server(self._handle, path=self.path)
+        dispatcher = asyncio.create_task(self._dispatch())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            dispatcher.cancel()
+            self._executor.shutdown(wait=True)
+            if os.path.exists(self.path): os.unlink(self.path)
+
+    async def _handle(self, reader, writer):
+        # Each client's requests wait in its own queue until its turn
+        self._queues[writer] = deque()
+        try:
+            while True:
+                header = await reader.readexactly(REQUEST.size)
+                op, seq, addr, reg, length = REQUEST.unpack(header)
+                payload = await reader.readexactly(length) if op in (OP_REGWR, OP_WRITE) else b""
+                self._queues[writer].append((op, seq, addr, reg, length, payload))
+                if writer not in self._ready: self._ready.append(writer)
+                self._work.set()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            del self._queues[writer]
+            if writer in self._ready: self._ready.remove(writer)
+            writer.close()
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if len(self._ready) == 0:
+                self._work.clear()
+                await self._work.wait()
+                continue
+            writer = self._ready.popleft()
+            op, seq, addr, reg, length, payload = self._queues[writer].popleft()
+            try:
+                status, data = await loop.run_in_executor(self._executor, self._perform,
+                                                          op, addr, reg, length, payload)
+            except Exception:
+                status, data = STATUS_ERROR, b""
+            self.served += 1
+
+            # The client may have gone, or queued more, while the bus was busy
+            if writer not in self._queues: continue
+            writer.write(RESPONSE.pack(status, seq, len(data)) + data)
+            if len(self._queues[writer]) > 0 and writer not in self._ready:
+                self._ready.append(writer)
+
+    def _perform(self, op, addr, reg, length, payload):
+        """
+        Run one request on the bus and return its status and any data read
+        """
+        if op == OP_REGRD:
+            return (STATUS_OK, self.i2c.regrd(addr, reg, length))
+        if op == OP_REGWR:
+            ok = self.i2c.regwr(addr, reg, payload)
+            return (STATUS_OK if ok else STATUS_NACK, b"")
+        if op == OP_WRITE:
+            ok = self.i2c.start(addr, 0)
+            if ok: ok = self.i2c.write(payload)
+            self.i2c.stop()
+            return (STATUS_OK if ok else STATUS_NACK, b"")
+        if op == OP_READ:
+            if not self.i2c.start(addr, 1):
+                self.i2c.stop()
+                return (STATUS_NACK, b"")
+            data = self.i2c.read(length)
+            self.i2c.stop()
+            return (STATUS_OK, data)
+        if op == OP_SCAN:
+            return (STATUS_OK, bytes(self.i2c.scan(True)))
+        return (STATUS_ERROR, b"")
+
+
+class BusClient:
+    """
+    A client for BusServer that can be passed to any of the drivers in place of an
+    i2cdriver.I2CDriver. Writes are pipelined: they are sent without waiting for
+    the daemon's reply, and their acknowledgements are collected by flush(), which
+    any read also calls, and which raises an i2cbatch.BatchError if any failed
+    """
+
+    MAX_PENDING = 64
+
+    def __init__(self, path=SOCKET_PATH):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self._file = self.sock.makefile("rb")
+        self._seq = 0
+        self._pending = []
+        self._dev = None
+        self._rw = 0
+        self._reg = None
+        self._out = bytearray()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def start(self, dev, rw):
+        # A repeated start: a lone register number written before reading the
+        # same device becomes a register read, which the daemon sends with a
+        # repeated start too. Anything else written so far goes as its own write
+        if self._dev is not None and self._rw == 0 and len(self._out) > 0:
+            if rw == 1 and dev == self._dev and len(self._out) == 1:
+                self._reg = self._out[0]
+            else:
+                self._post(OP_WRITE, self._dev, 0, self._out)
+        self._dev = dev
+        self._rw = rw
+        self._out.clear()
+        return True
+
+    def write(self, bb):
+        self._out += bytes(bb)
+        return True
+
+    def read(self, l):
+        if self._reg is not None:
+            reg, self._reg = self._reg, None
+            return self._call(OP_REGRD, self._dev, reg, l)
+        return self._call(OP_READ, self._dev, 0, l)
+
+    def stop(self):
+        if self._dev is not None and self._rw == 0:
+            self._post(OP_WRITE, self._dev, 0, self._out)
+        self._dev = None
+        self._reg = None
+
+    def regrd(self, dev, reg, fmt="B"):
+        if isinstance(fmt, str):
+            r = struct.unpack(fmt, self._call(OP_REGRD, dev, reg, struct.calcsize(fmt)))
+            return r[0] if len(r) == 1 else r
+        return self._call(OP_REGRD, dev, reg, fmt)
+
+    def regwr(self, dev, reg, vv):
+        if isinstance(vv, int): vv = struct.pack("B", vv)
+        self._post(OP_REGWR, dev, reg, bytes(vv))
+        return True
+
+    def scan(self, silent=False):
+        found = list(self._call(OP_SCAN, 0, 0, 0))
+        if not silent: print("\n".join([f"0x{addr:02X}" for addr in found]))
+        return found
+
+    def flush(self):
+        """
+        Collect the replies to the writes sent so far and return an (address,
+        acknowledged) tuple for each
+        """
+        pending, self._pending = self._pending, []
+        results = []
+        for addr in pending:
+            status, data = self._receive()
+            results.append((addr, status == STATUS_OK))
+        if not all([ok for addr, ok in results]): raise BatchError(results)
+        return results
+
+    def _send(self, op, addr, reg, length, payload=b""):
+        self._seq = (self._seq + 1) & 0xFFFF
+        self.sock.sendall(REQUEST.pack(op, self._seq, addr, reg, length) + payload)
+
+    def _post(self, op, addr, reg, payload):
+        self._send(op, addr, reg, len(payload), payload)
+        self._pending.append(addr)
+        if len(self._pending) >= self.MAX_PENDING: self.flush()
+
+    def _call(self, op, addr, reg, length):
+        self.flush()
+        self._send(op, addr, reg, length)
+        status, data = self._receive()
+        if status != STATUS_OK:
+            raise IOError(f"I2C request to 0x{addr:02X} failed (status {status})")
+        return data
+
+    def _receive(self):
+        status, seq, length = RESPONSE.unpack(self._file.read(RESPONSE.size))
+        return (status, self._file.read(length) if length > 0 else b"")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Share an I2CDriver Mini between local clients")
+    parser.add_argument("--socket", default=SOCKET_PATH, help="Unix domain socket to listen on")
+    parser.add_argument("--port", default="/dev/cu.usbserial-DO029IEZ", help="the I2CDriver's serial port")
+    args = parser.parse_args()
+
+    # Set I2C_STATS=text or I2C_STATS=json to report bus usage
+    i2c_bus = i2cstats.from_env(i2cdriver.I2CDriver(args.port))
+    try:
+        asyncio.run(BusServer(i2c_bus, args.socket).serve())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,205 @@
+"""
+Tiled displays for the I2CDriver Mini (https://i2cdriver.com/mini.html): one virtual
+canvas across several HT16K33 8 x 16 matrices, and one row of text across several
+HT16K33 four-digit, seven-segment displays
+"""
+
+import itertools
+from contextlib import ExitStack
+from scheduler import FrameScheduler
+
+
+def update_all(drivers):
+    """
+    Update every driver, batching the writes for each bus that supports it
+    (see i2cbatch.BatchedI2C). Unchanged displays send nothing
+    """
+    with ExitStack() as stack:
+        buses = []
+        for driver in drivers:
+            if driver.i2c not in buses and hasattr(driver.i2c, "batch"):
+                buses.append(driver.i2c)
+                stack.enter_context(driver.i2c.batch())
+        for driver in drivers:
+            driver.update()
+
+
+class TiledCanvas:
+    """
+    A virtual canvas made of 8 x 16 LED matrix panels (matrix.HT16K33 instances),
+    which may be on different addresses or buses. Each panel is given as a tuple:
+    (driver, x, y, rotation), where (x, y) is the canvas position of the panel's
+    top-left corner and rotation is 0, 90, 180 or 270 degrees clockwise. Canvas
+    y counts down from the top edge, across panel rows
+    """
+
+    # Reverses the bit order of a column byte, for panels turned through 180 degrees
+    REVERSE = bytes([int(f"{b:08b}"[::-1], 2) for b in range(0, 256)])
+
+    def __init__(self, panels):
+        self.panels = [(driver, x, y, rotation % 360) for driver, x, y, rotation in panels]
+        self.drivers = [panel[0] for panel in self.panels]
+        self.width = 0
+        self.height = 0
+        for driver, x, y, rotation in self.panels:
+            w, h = self._get_footprint(driver, rotation)
+            self.width = max(self.width, x + w)
+            self.height = max(self.height, y + h)
+
+        # Map every canvas pixel to its panel buffer byte and bit, and every
+        # eight-pixel canvas column that lies along a panel column to that
+        # panel's buffer byte, so drawing never has to search the layout
+        self._pixels = [None] * (self.width * self.height)
+        self._columns = {}
+        for driver, x, y, rotation in self.panels:
+            w, h = self._get_footprint(driver, rotation)
+            for u, v in itertools.product(range(0, w), range(0, h)):
+                px, py = self._to_panel(driver, rotation, u, v)
+                self._pixels[(y + v) * self.width + x + u] = (driver.buffer, driver.ROW_MAP[px], 1 << py)
+            if rotation in (0, 180):
+                for u in range(0, w):
+                    px = u if rotation == 0 else w - 1 - u
+                    self._columns[(x + u, y)] = (driver.buffer, driver.ROW_MAP[px], rotation == 180)
+
+    @classmethod
+    def grid(cls, drivers, columns, rotation=0):
+        """
+        Lay the panels out left to right, top to bottom, 'columns' panels wide
+        """
+        panels = []
+        for i, driver in enumerate(drivers):
+            w, h = cls._get_footprint(driver, rotation)
+            panels.append((driver, (i % columns) * w, (i // columns) * h, rotation))
+        return cls(panels)
+
+    def clear(self):
+        for driver in self.drivers: driver.clear()
+        return self
+
+    def plot(self, x, y, colour=1):
+        if (0 <= x < self.width) and (0 <= y < self.height):
+            target = self._pixels[y * self.width + x]
+            if target is None: return None
+            buffer, index, bit = target
+            if colour == 1:
+                buffer[index] |= bit
+            else:
+                buffer[index] &= ~bit & 0xFF
+            return self
+        return None
+
+    def set_column(self, x, col, y=0):
+        """
+        Set the eight pixels from (x, y) downwards from a column byte, as used by
+        the matrix CHARSET: bit 7 at (x, y), bit 0 at (x, y + 7). Panels at 0 or
+        180 degrees take the whole byte at once
+        """
+        target = self._columns.get((x, y))
+        if target is not None:
+            buffer, index, flip = target
+            buffer[index] = self.REVERSE[col] if flip else col
+            return self
+        for bit in range(0, 8):
+            self.plot(x, y + 7 - bit, (col >> bit) & 1)
+        return self
+
+    def draw_text(self, the_line, x=0, y=0):
+        """
+        Draw a line of text, which flows across panel boundaries
+        """
+        strip = self.drivers[0].get_strip(the_line)
+        for i, col in enumerate(strip.columns):
+            if 0 <= x + i < self.width: self.set_column(x + i, col, y)
+        return self
+
+    def scroll_text(self, the_line, speed=0.1, y=0):
+        """
+        Scroll a line of text across the whole width of the canvas
+        """
+        if the_line is None or len(the_line) == 0: return None
+        strip = self.drivers[0].get_strip(the_line)
+        cols = bytes(self.width) + strip.columns + bytes(self.width)
+        timer = FrameScheduler(period=speed)
+        for start in timer.run(range(0, len(cols) - self.width + 1)):
+            for i in range(0, self.width):
+                self.set_column(i, cols[start + i], y)
+            self.update()
+        return timer.stats()
+
+    def update(self):
+        """
+        Send the panels that have changed, batching them per bus
+        """
+        update_all(self.drivers)
+        return self
+
+    @staticmethod
+    def _get_footprint(driver, rotation):
+        if rotation in (90, 270): return (driver.DISPLAY_HEIGHT, driver.DISPLAY_WIDTH)
+        return (driver.DISPLAY_WIDTH, driver.DISPLAY_HEIGHT)
+
+    @staticmethod
+    def _to_panel(driver, rotation, u, v):
+        """
+        Convert a position within a panel's footprint on the canvas, where v
+        counts down from the top, to the panel's own (x, y) pixel coordinates,
+        where y counts up from the bottom
+        """
+        w = driver.DISPLAY_WIDTH - 1
+        h = driver.DISPLAY_HEIGHT - 1
+        if rotation == 90: return (v, u)
+        if rotation == 180: return (w - u, v)
+        if rotation == 270: return (w - v, h - u)
+        return (u, h - v)
+
+
+class SegmentRow:
+    """
+    A row of four-digit, seven-segment displays (counter.HT16K33 instances)
+    treated as one long display, left to right
+    """
+
+    def __init__(self, drivers):
+        self.drivers = list(drivers)
+        self.width = 4 * len(self.drivers)
+
+    def clear(self):
+        return self.set_text("")
+
+    def set_text(self, text):
+        """
+        Show text made of the characters set_char() supports, padded with spaces.
+        A '.' lights the decimal point of the digit before it
+        """
+        digits = []
+        for char in text:
+            if char == "." and len(digits) > 0 and not digits[-1][1]:
+                digits[-1] = (digits[-1][0], True)
+            else:
+                digits.append((char, False))
+        digits += [(" ", False)] * (self.width - len(digits))
+
+        for i in range(0, self.width):
+            char, has_dot = digits[i]
+            driver = self.drivers[i >> 2]
+            if char.lower() not in driver.glyphs: char = " "
+            driver.set_char(char, i & 3, has_dot)
+        return self
+
+    def scroll_text(self, text, speed=0.25):
+        """
+        Scroll text across the row, one digit per step
+        """
+        padded = " " * self.width + text + " " * self.width
+        timer = FrameScheduler(period=speed)
+        for start in timer.run(range(0, len(padded) - self.width + 1)):
+            self.set_text(padded[start:start + self.width])
+            self.update()
+        return timer.stats()
+
+    def update(self):
+        """
+        Send the displays whose digits have changed, batching them per bus
+        """
+        update_all(self.drivers)
+        return self
@@ -4,8 +4,10 @@ and an HT16K33-based 4-digit, 7-segment LED
 (https://learn.adafruit.com/adafruit-7-segment-led-featherwings/overview)
 """
 
-import time
 import i2cdriver
+import i2cstats
+from i2cbatch import BatchedI2C
+from scheduler import FrameScheduler
 
 
 class HT16K33:
@@ -32,13 +34,28 @@ class HT16K33:
     # 0-9, A-F, minus, degree
     chars = b'\x3F\x06\x5B\x4F\x66\x6D\x7D\x07\x7F\x6F\x5F\x7C\x58\x5E\x7B\x71\x40\x63'
 
+    # The glyph for each character set_char() can show
+    glyphs = dict(zip("0123456789abcdef-", chars))
+    glyphs[" "] = 0x00
+
+    # How many complete frames set_value() will remember
+    FRAME_CACHE_SIZE = 20000
+
     def __init__(self, i2c, address=0x70):
         """
         Instantiate the LED object and power it up
         """
         self.i2c = i2c
         self.addr = address
-        self.buffer = bytearray(16)
+        # The transmit buffer holds the RAM address byte followed by the
+        # framebuffer, so update() can write it out without copying
+        self._tx = bytearray(17)
+        self._txview = memoryview(self._tx)
+        self.buffer = self._txview[1:]
+        self._colon = 0x00
+        self._frames = {}
+        self._sent = bytearray(16)
+        self._synced = False
 
         # Initialize display: clock on, display on
         self.send_command(self.HT16K33_SEGMENT_SYSTEM_ON)
@@ -64,7 +81,8 @@ class HT16K33:
         """
         Set or unset the display's central colon symbol.
         """
-        self.buffer[self.HT16K33_SEGMENT_COLON_ROW] = 0x02 if is_set is True else 0x00
+        self._colon = 0x02 if is_set is True else 0x00
+        self.buffer[self.HT16K33_SEGMENT_COLON_ROW] = self._colon
 
     def set_number(self, number, digit=0, has_dot=False):
         """
@@ -79,21 +97,80 @@ class HT16K33:
         If 'has_dot' is true, the adjacent decimal point will be lit
         """
         if not 0 <= digit <= 3: return
-        char = char.lower()
-        if char in 'abcdef':
-            char_val = ord(char) - 87
-        elif char == '-':
-            char_val = self.HT16K33_SEGMENT_MINUS_CHAR
-        elif char in '0123456789':
-            char_val = ord(char) - 48
-        elif char == ' ':
-            char_val = 0x00
-        else:
-            return
+        glyph = self.glyphs.get(char.lower())
+        if glyph is None: return
 
-        self.buffer[self.pos[digit]] = self.chars[char_val]
+        self.buffer[self.pos[digit]] = glyph
         if has_dot is True: self.buffer[self.pos[digit]] |= 0b10000000
 
+    def set_value(self, value, decimals=0, is_hex=False, leading_zeros=False):
+        """
+        Show a whole value across the four digits: an integer (-999 to 9999), a
+        fixed-point number with 'decimals' digits after the decimal point or, if
+        'is_hex' is true, a hexadecimal integer (-0xFFF to 0xFFFF).
+        Frames are built from the glyph table and cached, so showing a value
+        again costs one lookup and one buffer copy
+        """
+        key = (value, decimals, is_hex, leading_zeros, self._colon)
+        frame = self._frames.get(key)
+        if frame is None:
+            frame = self._make_frame(value, decimals, is_hex, leading_zeros)
+            if frame is None: return None
+            if len(self._frames) < self.FRAME_CACHE_SIZE: self._frames[key] = frame
+
+        self.buffer[0:len(frame)] = frame
+        return self
+
+    def _make_frame(self, value, decimals, is_hex, leading_zeros):
+        """
+        Return the buffer bytes, up to and including the last digit's, for a value
+        """
+        if is_hex is True:
+            base = 16
+            decimals = 0
+            number = int(value)
+        else:
+            base = 10
+            number = int(round(value * 10 ** decimals))
+        if not 0 <= decimals <= 3: return None
+
+        negative = number < 0
+        number = abs(number)
+        width = 3 if negative else 4
+
+        # Fill from the right, with at least one digit ahead of the point
+        glyphs = []
+        while number > 0 or len(glyphs) <= decimals:
+            number, digit = divmod(number, base)
+            glyphs.append(self.chars[digit])
+        if len(glyphs) > width: return None
+
+        if leading_zeros is True: glyphs += [self.chars[0]] * (width - len(glyphs))
+        if negative: glyphs.append(self.chars[self.HT16K33_SEGMENT_MINUS_CHAR])
+        glyphs += [0x00] * (4 - len(glyphs))
+
+        frame = bytearray(self.pos[3] + 1)
+        for digit in range(0, 4):
+            frame[self.pos[digit]] = glyphs[3 - digit]
+        if decimals > 0: frame[self.pos[3 - decimals]] |= 0b10000000
+        frame[self.HT16K33_SEGMENT_COLON_ROW] = self._colon
+        return bytes(frame)
+
+    def play(self, frames, fps=30, drop=True):
+        """
+        Show a sequence of frames at a fixed rate and return the timing statistics.
+        Each frame is either a complete buffer image or a function that is passed
+        the LED object to draw on
+        """
+        timer = FrameScheduler(fps, drop)
+        for frame in timer.run(frames):
+            if callable(frame):
+                frame(self)
+            else:
+                self.buffer[:] = frame
+            self.update()
+        return timer.stats()
+
     def send_command(self, byte):
         """
         Send a command byte to the LED
@@ -102,43 +179,43 @@ class HT16K33:
         self.i2c.write([byte])
         self.i2c.stop()
 
-    def update(self):
+    def update(self, full=False):
         """
-        Write the buffer to the LED
+        Write the buffer to the LED, unless it is unchanged since the last update.
+        Pass full=True to send it regardless
         """
-        bfr = [0x00]
-        for i in range(0, len(self.buffer)):
-            bfr.append(self.buffer[i])
+        if full is False and self._synced is True and self.buffer == self._sent: return self
         self.i2c.start(self.addr, 0)
-        self.i2c.write(bfr)
+        self.i2c.write(self._txview)
         self.i2c.stop()
+        self._sent[:] = self.buffer
+        self._synced = True
+
+        # Inside a batch the write is only queued: if it never arrives, the
+        # next update has to send the buffer regardless
+        on_failure = getattr(self.i2c, "on_failure", None)
+        if on_failure is not None: on_failure(self._set_unsynced)
+        return self
+
+    def _set_unsynced(self):
+        self._synced = False
 
 
 if __name__ == '__main__':
-    i2c_bus = i2cdriver.I2CDriver("/dev/cu.usbserial-DO029IEZ")
-    led = HT16K33(i2c_bus)
-    count = 0
+    # Set I2C_STATS=text or I2C_STATS=json to report bus usage
+    i2c_bus = i2cstats.from_env(BatchedI2C(i2cdriver.I2CDriver("/dev/cu.usbserial-DO029IEZ")))
+    with i2c_bus.batch():
+        led = HT16K33(i2c_bus)
+    timer = FrameScheduler(100)
 
     # Loop and count upwards
-    while count < 10000:
-        count_bcd = int(str(count), 16)
-        led.set_number((count_bcd & 0xF000) >> 12, 0)
-        led.set_number((count_bcd & 0x0F00) >> 8, 1)
-        led.set_number((count_bcd & 0xF0) >> 4, 2)
-        led.set_number((count_bcd & 0x0F), 3)
+    for count in timer.run(range(0, 10000)):
+        led.set_value(count, leading_zeros=True)
         led.update()
-        count += 1
-        time.sleep(0.01)
 
     led.set_colon()
 
-    # Loop and count upwards
-    while count > -1:
-        count_bcd = int(str(count), 16)
-        led.set_number((count_bcd & 0xF000) >> 12, 0)
-        led.set_number((count_bcd & 0x0F00) >> 8, 1)
-        led.set_number((count_bcd & 0xF0) >> 4, 2)
-        led.set_number((count_bcd & 0x0F), 3)
+    # Loop and count downwards
+    for count in timer.run(range(9999, -1, -1)):
+        led.set_value(count, leading_zeros=True)
         led.update()
-        count -= 1
-        time.sleep(0.01)
@@ -2,9 +2,15 @@
 CPU utilization readout using the I2CDriver Mini (https://i2cdriver.com/mini.html)
 """
 
+import sys
 import time
+import itertools
+import threading
 import psutil
 import i2cdriver
+import i2cstats
+from i2cbatch import BatchedI2C
+from scheduler import FrameScheduler
 
 class HT16K33:
     """
@@ -30,13 +36,28 @@ class HT16K33:
     # 0-9, A-F, minus, degree
     chars = b'\x3F\x06\x5B\x4F\x66\x6D\x7D\x07\x7F\x6F\x5F\x7C\x58\x5E\x7B\x71\x40\x63'
 
+    # The glyph for each character set_char() can show
+    glyphs = dict(zip("0123456789abcdef-", chars))
+    glyphs[" "] = 0x00
+
+    # How many complete frames set_value() will remember
+    FRAME_CACHE_SIZE = 20000
+
     def __init__(self, i2c, address=0x70):
         """
         Instantiate the LED object and power it up
         """
         self.i2c = i2c
         self.addr = address
-        self.buffer = bytearray(16)
+        # The transmit buffer holds the RAM address byte followed by the
+        # framebuffer, so update() can write it out without copying
+        self._tx = bytearray(17)
+        self._txview = memoryview(self._tx)
+        self.buffer = self._txview[1:]
+        self._colon = 0x00
+        self._frames = {}
+        self._sent = bytearray(16)
+        self._synced = False
 
         # Initialize display: clock on, display on
         self.send_command(self.HT16K33_SEGMENT_SYSTEM_ON)
@@ -62,7 +83,8 @@ class HT16K33:
         """
         Set or unset the display's central colon symbol.
         """
-        self.buffer[self.HT16K33_SEGMENT_COLON_ROW] = 0x02 if is_set is True else 0x00
+        self._colon = 0x02 if is_set is True else 0x00
+        self.buffer[self.HT16K33_SEGMENT_COLON_ROW] = self._colon
 
     def set_number(self, number, digit=0, has_dot=False):
         """
@@ -77,21 +99,80 @@ class HT16K33:
         If 'has_dot' is true, the adjacent decimal point will be lit
         """
         if not 0 <= digit <= 3: return
-        char = char.lower()
-        if char in 'abcdef':
-            char_val = ord(char) - 87
-        elif char == '-':
-            char_val = self.HT16K33_SEGMENT_MINUS_CHAR
-        elif char in '0123456789':
-            char_val = ord(char) - 48
-        elif char == ' ':
-            char_val = 0x00
-        else:
-            return
+        glyph = self.glyphs.get(char.lower())
+        if glyph is None: return
 
-        self.buffer[self.pos[digit]] = self.chars[char_val]
+        self.buffer[self.pos[digit]] = glyph
         if has_dot is True: self.buffer[self.pos[digit]] |= 0b10000000
 
+    def set_value(self, value, decimals=0, is_hex=False, leading_zeros=False):
+        """
+        Show a whole value across the four digits: an integer (-999 to 9999), a
+        fixed-point number with 'decimals' digits after the decimal point or, if
+        'is_hex' is true, a hexadecimal integer (-0xFFF to 0xFFFF).
+        Frames are built from the glyph table and cached, so showing a value
+        again costs one lookup and one buffer copy
+        """
+        key = (value, decimals, is_hex, leading_zeros, self._colon)
+        frame = self._frames.get(key)
+        if frame is None:
+            frame = self._make_frame(value, decimals, is_hex, leading_zeros)
+            if frame is None: return None
+            if len(self._frames) < self.FRAME_CACHE_SIZE: self._frames[key] = frame
+
+        self.buffer[0:len(frame)] = frame
+        return self
+
+    def _make_frame(self, value, decimals, is_hex, leading_zeros):
+        """
+        Return the buffer bytes, up to and including the last digit's, for a value
+        """
+        if is_hex is True:
+            base = 16
+            decimals = 0
+            number = int(value)
+        else:
+            base = 10
+            number = int(round(value * 10 ** decimals))
+        if not 0 <= decimals <= 3: return None
+
+        negative = number < 0
+        number = abs(number)
+        width = 3 if negative else 4
+
+        # Fill from the right, with at least one digit ahead of the point
+        glyphs = []
+        while number > 0 or len(glyphs) <= decimals:
+            number, digit = divmod(number, base)
+            glyphs.append(self.chars[digit])
+        if len(glyphs) > width: return None
+
+        if leading_zeros is True: glyphs += [self.chars[0]] * (width - len(glyphs))
+        if negative: glyphs.append(self.chars[self.HT16K33_SEGMENT_MINUS_CHAR])
+        glyphs += [0x00] * (4 - len(glyphs))
+
+        frame = bytearray(self.pos[3] + 1)
+        for digit in range(0, 4):
+            frame[self.pos[digit]] = glyphs[3 - digit]
+        if decimals > 0: frame[self.pos[3 - decimals]] |= 0b10000000
+        frame[self.HT16K33_SEGMENT_COLON_ROW] = self._colon
+        return bytes(frame)
+
+    def play(self, frames, fps=30, drop=True):
+        """
+        Show a sequence of frames at a fixed rate and return the timing statistics.
+        Each frame is either a complete buffer image or a function that is passed
+        the LED object to draw on
+        """
+        timer = FrameScheduler(fps, drop)
+        for frame in timer.run(frames):
+            if callable(frame):
+                frame(self)
+            else:
+                self.buffer[:] = frame
+            self.update()
+        return timer.stats()
+
     def send_command(self, byte):
         """
         Send a command byte to the LED
@@ -100,44 +181,100 @@ class HT16K33:
         self.i2c.write([byte])
         self.i2c.stop()
 
-    def update(self):
+    def update(self, full=False):
         """
-        Write the buffer to the LED
+        Write the buffer to the LED, unless it is unchanged since the last update.
+        Pass full=True to send it regardless
         """
-        bfr = [0x00]
-        for i in range(0, len(self.buffer)):
-            bfr.append(self.buffer[i])
+        if full is False and self._synced is True and self.buffer == self._sent: return self
         self.i2c.start(self.addr, 0)
-        self.i2c.write(bfr)
+        self.i2c.write(self._txview)
         self.i2c.stop()
+        self._sent[:] = self.buffer
+        self._synced = True
+
+        # Inside a batch the write is only queued: if it never arrives, the
+        # next update has to send the buffer regardless
+        on_failure = getattr(self.i2c, "on_failure", None)
+        if on_failure is not None: on_failure(self._set_unsynced)
+        return self
+
+    def _set_unsynced(self):
+        self._synced = False
+
+
+class CPUSampler:
+    """
+    Samples system and per-core CPU utilization, and memory use, on a background
+    thread every 'period' seconds. The latest figures are published as a tuple in
+    'snapshot': (time, system %, tuple of per-core %, memory %), or None before
+    the first sample. The tuple is replaced whole, so readers never wait and
+    never see half an update
+    """
+
+    def __init__(self, period=0.5):
+        self.period = period
+        self.snapshot = None
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        if self._running: return self
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="CPUSampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None: self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        # psutil measures each interval on this thread, so only the sampler waits
+        psutil.cpu_percent(percpu=True)
+        while self._running:
+            cores = tuple(psutil.cpu_percent(interval=self.period, percpu=True))
+            system = sum(cores) / len(cores) if len(cores) > 0 else 0.0
+            self.snapshot = (time.monotonic(), system, cores, psutil.virtual_memory().percent)
 
 
 if __name__ == '__main__':
-    i2c_bus = i2cdriver.I2CDriver("/dev/cu.usbserial-DO029IEZ")
-    led = HT16K33(i2c_bus)
+    # Set I2C_STATS=text or I2C_STATS=json to report bus usage
+    # Pass --matrix to show per-core bars on an 8 x 16 LED matrix instead
+    i2c_bus = i2cstats.from_env(BatchedI2C(i2cdriver.I2CDriver("/dev/cu.usbserial-DO029IEZ")))
+    use_matrix = "--matrix" in sys.argv[1:]
+    with i2c_bus.batch():
+        if use_matrix:
+            from matrix import HT16K33 as MatrixLED
+            led = MatrixLED(i2c_bus)
+        else:
+            led = HT16K33(i2c_bus)
 
+    sampler = CPUSampler(0.5).start()
     alert = False
-    while True:
-        # Get the CPU utilization and calculate
-        # the Binary-Coded Decimal (BCD) form
-        cpu_util = int(psutil.cpu_percent())
-        bcd_value = int(str(cpu_util), 16)
-
-        # Display the percentage as decimal digits
-        led.set_number((bcd_value & 0x0F00) >> 8, 1)
-        led.set_number((bcd_value & 0xF0) >> 4, 2)
-        led.set_number((bcd_value & 0x0F), 3)
-        led.update()
-
-        # Alert?
-        if cpu_util > 79:
-            if not alert:
-                led.set_flash(2)
-                alert = True
+
+    # Check for a new snapshot ten times a second; update() sends nothing
+    # if the frame drawn from it has not changed
+    for frame in FrameScheduler(10).run(itertools.count()):
+        snapshot = sampler.snapshot
+        if snapshot is None: continue
+        stamp, cpu_util, cores, memory = snapshot
+        if use_matrix:
+            led.bar_graph(cores)
         else:
-            if alert:
-                led.set_flash()
-                alert = False
+            led.set_value(int(cpu_util))
+
+        # Send the frame and any change of flash rate together
+        with i2c_bus.batch():
+            led.update()
 
-        # Pause for breath
-        time.sleep(0.5)
+            # Alert?
+            if cpu_util > 79:
+                if not alert:
+                    led.set_flash(2)
+                    alert = True
+            else:
+                if alert:
+                    led.set_flash()
+                    alert = False
@@ -0,0 +1,442 @@
+"""
+A simulated I2CDriver Mini (https://i2cdriver.com/mini.html) for exercising and
+benchmarking the drivers without the hardware
+"""
+
+import time
+import i2cdriver
+
+
+class LatencyModel:
+    """
+    The cost, in seconds, of moving data through an I2CDriver Mini: each byte on
+    the USB serial link, each byte (including address bytes) on the I2C bus, and
+    each time the host has to wait for a reply from the board
+    """
+
+    def __init__(self, serial_byte=0.00001, i2c_byte=0.00009, round_trip=0.001):
+        self.serial_byte = serial_byte
+        self.i2c_byte = i2c_byte
+        self.round_trip = round_trip
+
+
+class DeviceModel:
+    """
+    Base class for simulated I2C peripherals. The first byte written in each
+    transaction sets the register pointer; reads and further writes start there
+    """
+
+    def __init__(self):
+        self.pointer = 0
+        self._first = True
+
+    def start(self, rw):
+        if rw == 0: self._first = True
+
+    def stop(self):
+        pass
+
+    def write(self, data):
+        for byte in data:
+            if self._first:
+                self.command(byte)
+                self._first = False
+            else:
+                self.write_byte(byte)
+
+    def read(self, count):
+        return bytes([self.read_byte() for i in range(0, count)])
+
+    def command(self, byte):
+        self.pointer = byte
+
+    def write_byte(self, byte):
+        pass
+
+    def read_byte(self):
+        return 0x00
+
+
+class HT16K33Model(DeviceModel):
+    """
+    The Holtek HT16K33 LED controller: 16 bytes of display RAM with a wrapping
+    address pointer, plus the system, display and dimming command registers
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.ram = bytearray(16)
+        self.oscillator = False
+        self.display_on = False
+        self.blink = 0
+        self.brightness = 15
+        self.writes = 0
+
+    def command(self, byte):
+        if byte < 0x10:
+            self.pointer = byte
+            self.writes += 1
+        elif byte & 0xF0 == 0x20:
+            self.oscillator = (byte & 0x01) == 1
+        elif byte & 0xF0 == 0x80:
+            self.display_on = (byte & 0x01) == 1
+            self.blink = (byte >> 1) & 0x03
+        elif byte & 0xF0 == 0xE0:
+            self.brightness = byte & 0x0F
+
+    def write_byte(self, byte):
+        self.ram[self.pointer] = byte
+        self.pointer = (self.pointer + 1) & 0x0F
+
+    def read_byte(self):
+        byte = self.ram[self.pointer]
+        self.pointer = (self.pointer + 1) & 0x0F
+        return byte
+
+
+class MCP9808Model(DeviceModel):
+    """
+    The Microchip MCP9808 temperature sensor: 16-bit, big-endian registers and
+    the 8-bit resolution register. Set 'temperature' to change the reading
+    """
+
+    REG_CONFIG = 0x01
+    REG_UPPER = 0x02
+    REG_LOWER = 0x03
+    REG_CRIT = 0x04
+    REG_AMBIENT = 0x05
+    REG_MANUF_ID = 0x06
+    REG_DEVICE_ID = 0x07
+    REG_RESOLUTION = 0x08
+
+    def __init__(self, temperature=21.5):
+        super().__init__()
+        self.temperature = temperature
+        self.registers = [0x0000] * 9
+        self.registers[self.REG_MANUF_ID] = 0x0054
+        self.registers[self.REG_DEVICE_ID] = 0x0400
+        self.registers[self.REG_RESOLUTION] = 0x03
+        self._data = []
+        self._out = b""
+
+    def command(self, byte):
+        self.pointer = byte & 0x0F
+        self._data = []
+        self._out = b""
+
+    def write_byte(self, byte):
+        if self.pointer > self.REG_RESOLUTION: return
+        self._data.append(byte)
+        if self.pointer == self.REG_RESOLUTION:
+            self.registers[self.pointer] = self._data[0] & 0x03
+        elif len(self._data) == 2 and self.REG_CONFIG <= self.pointer <= self.REG_CRIT:
+            self.registers[self.pointer] = (self._data[0] << 8) | self._data[1]
+
+    def read_byte(self):
+        if len(self._out) == 0:
+            self._out = self.get_register(self.pointer)
+        byte = self._out[0]
+        self._out = self._out[1:]
+        return byte
+
+    def get_register(self, reg):
+        if reg == self.REG_AMBIENT:
+            value = self.encode(self.temperature)
+            # Drop the bits below the selected resolution
+            value &= 0x1FFF ^ ((1 << (3 - self.registers[self.REG_RESOLUTION])) - 1)
+            if self.temperature >= self.decode(self.registers[self.REG_CRIT]): value |= 0x8000
+            if self.temperature > self.decode(self.registers[self.REG_UPPER]): value |= 0x4000
+            if self.temperature < self.decode(self.registers[self.REG_LOWER]): value |= 0x2000
+            return value.to_bytes(2, "big")
+        if reg == self.REG_RESOLUTION:
+            return bytes([self.registers[reg]])
+        if reg < len(self.registers):
+            return self.registers[reg].to_bytes(2, "big")
+        return bytes(2)
+
+    @staticmethod
+    def encode(temperature):
+        return int(round(temperature * 16)) & 0x1FFF
+
+    @staticmethod
+    def decode(value):
+        value &= 0x1FFF
+        if value & 0x1000: value -= 0x2000
+        return value / 16
+
+
+class TSL2561Model(DeviceModel):
+    """
+    The AMS TSL2561 light sensor. Register access needs the command bit set in the
+    command byte, and the register address auto-increments. Set 'broadband' and
+    'infrared' to the channel counts the part would give at 402ms and 16x gain
+    """
+
+    CMD = 0x80
+    CMD_CLEAR = 0x40
+    REG_CONTROL = 0x00
+    REG_TIMING = 0x01
+    REG_INTERRUPT = 0x06
+    REG_ID = 0x0A
+    REG_DATA = 0x0C
+
+    # Full-scale counts for the 13.7ms, 101ms and 402ms integration times
+    SATURATION = [5047, 37177, 65535]
+    SCALE = [0.034, 0.252, 1.0]
+
+    def __init__(self, broadband=1200, infrared=300):
+        super().__init__()
+        self.broadband = broadband
+        self.infrared = infrared
+        self.registers = bytearray(16)
+        self.registers[self.REG_TIMING] = 0x02
+        self.registers[self.REG_ID] = 0x50
+        self.interrupt = False
+        self._active = False
+
+    def command(self, byte):
+        self._active = (byte & self.CMD) != 0
+        if not self._active: return
+        if byte & self.CMD_CLEAR: self.interrupt = False
+        self.pointer = byte & 0x0F
+
+    def write_byte(self, byte):
+        if not self._active: return
+        if self.pointer < self.REG_ID: self.registers[self.pointer] = byte
+        self.pointer = (self.pointer + 1) & 0x0F
+
+    def read_byte(self):
+        if self.pointer >= self.REG_DATA:
+            ch0, ch1 = self.get_channels()
+            data = ch0.to_bytes(2, "little") + ch1.to_bytes(2, "little")
+            byte = data[self.pointer - self.REG_DATA]
+        else:
+            byte = self.registers[self.pointer]
+        self.pointer = (self.pointer + 1) & 0x0F
+        return byte
+
+    def get_channels(self):
+        """
+        Return the ADC counts for the current power, gain and integration settings
+        """
+        if self.registers[self.REG_CONTROL] & 0x03 != 0x03: return (0, 0)
+        timing = self.registers[self.REG_TIMING]
+        integ = min(timing & 0x03, 2)
+        scale = self.SCALE[integ] / (1 if timing & 0x10 else 16)
+        ceiling = self.SATURATION[integ]
+        return (min(int(self.broadband * scale), ceiling),
+                min(int(self.infrared * scale), ceiling))
+
+
+class FakeSerial:
+    """
+    Stands in for the I2CDriver's USB serial port: parses the command stream the
+    i2cdriver library sends, drives the device models and queues their replies.
+    Costs from the latency model are added to 'elapsed' (and slept, if realtime)
+    """
+
+    def __init__(self, bus):
+        self.bus = bus
+        self._pending = bytearray()
+        self._reply = bytearray()
+        self._cost = 0.0
+        self._waiting = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.bus.serial_bytes += len(data)
+        self._cost += len(data) * self.bus.latency.serial_byte
+        self._pending += data
+        self._waiting = True
+        self._parse()
+        self.bus.charge(self._cost)
+        self._cost = 0.0
+        return len(data)
+
+    def read(self, count=1):
+        if self._waiting:
+            # The host blocks here until the board has replied
+            self.bus.round_trips += 1
+            self._cost += self.bus.latency.round_trip
+            self._waiting = False
+        data = bytes(self._reply[:count])
+        del self._reply[:count]
+        self.bus.serial_bytes += len(data)
+        self._cost += len(data) * self.bus.latency.serial_byte
+        self.bus.charge(self._cost)
+        self._cost = 0.0
+        return data
+
+    def flush(self):
+        pass
+
+    def inWaiting(self):
+        return len(self._reply)
+
+    def _parse(self):
+        """
+        Run every complete command in the pending input
+        """
+        bus = self.bus
+        data = self._pending
+        while len(data) > 0:
+            cmd = data[0]
+            if cmd == 0x73:
+                # 's': start, followed by (address << 1) | rw
+                if len(data) < 2: break
+                self._reply.append(bus.bus_start(data[1] >> 1, data[1] & 0x01))
+                del data[:2]
+            elif cmd >= 0xC0:
+                # Write 1-64 bytes
+                count = cmd - 0xBF
+                if len(data) < count + 1: break
+                self._reply.append(bus.bus_write(bytes(data[1:count + 1])))
+                del data[:count + 1]
+            elif cmd >= 0x80:
+                # Read 1-64 bytes, NAK the last
+                self._reply += bus.bus_read(cmd - 0x7F)
+                del data[:1]
+            elif cmd == 0x61:
+                # 'a': read N bytes, ACK them all
+                if len(data) < 2: break
+                self._reply += bus.bus_read(data[1])
+                del data[:2]
+            elif cmd == 0x70:
+                # 'p': stop
+                bus.bus_stop()
+                del data[:1]
+            elif cmd == 0x72:
+                # 'r': register read, followed by address, register and count
+                if len(data) < 4: break
+                dev, reg, count = data[1], data[2], data[3]
+                if bus.bus_start(dev, 0) & 0x01:
+                    bus.bus_write(bytes([reg]))
+                    bus.bus_start(dev, 1)
+                    self._reply += bus.bus_read(count or 256)
+                else:
+                    self._reply += bytes(count or 256)
+                bus.bus_stop()
+                del data[:4]
+            elif cmd == 0x64:
+                # 'd': scan addresses 0x08-0x77
+                self._reply += b"".join([b"1" if a in bus.devices else b"." for a in range(8, 120)])
+                del data[:1]
+            elif cmd == 0x65:
+                # 'e': echo
+                if len(data) < 2: break
+                self._reply.append(data[1])
+                del data[:2]
+            elif cmd == 0x3F:
+                # '?': status
+                self._reply += bus.get_status_line()
+                del data[:1]
+            elif cmd == 0x78:
+                # 'x': bus reset, SDA and SCL both high
+                self._reply.append(0x03)
+                del data[:1]
+            elif cmd == 0x75:
+                # 'u': pullups, followed by the mask
+                if len(data) < 2: break
+                del data[:2]
+            else:
+                # Speed, monitor, reboot and padding commands need no reply
+                del data[:1]
+
+
+class FakeI2CDriver(i2cdriver.I2CDriver):
+    """
+    A drop-in replacement for i2cdriver.I2CDriver. All the library's own methods
+    run unchanged against a FakeSerial link, so the serial traffic, round trips
+    and bus bytes match those of the real board. Device models are attached by
+    7-bit address; the defaults match the parts used by these demos
+    """
+
+    def __init__(self, devices=None, latency=None, realtime=False, serial="FAKE0001"):
+        if devices is None:
+            devices = {0x18: MCP9808Model(), 0x39: TSL2561Model(), 0x70: HT16K33Model()}
+        self.devices = devices
+        self.latency = latency if latency is not None else LatencyModel()
+        self.realtime = realtime
+        self.serial_number = serial
+        self.elapsed = 0.0
+        self.reset_stats()
+        self._device = None
+        self.ser = FakeSerial(self)
+        self.getstatus()
+        self.speed = 100
+
+    def reset_stats(self):
+        self.elapsed = 0.0
+        self.round_trips = 0
+        self.serial_bytes = 0
+        self.i2c_bytes = 0
+        self.transactions = 0
+
+    def charge(self, seconds):
+        """
+        Add simulated time, sleeping it off if running in real time
+        """
+        self.elapsed += seconds
+        if self.realtime is True and seconds > 0: time.sleep(seconds)
+
+    def get_status_line(self):
+        body = f"[i2cdriverm {self.serial_number} 000000001 5.000 000 25.0 I 1 1 100 24 0000"
+        return (body.ljust(79) + "]").encode()
+
+    def bus_start(self, dev, rw):
+        self.transactions += 1
+        self._count_i2c(1)
+        self._device = self.devices.get(dev)
+        if self._device is None: return 0x00
+        self._device.start(rw)
+        return 0x01
+
+    def bus_write(self, data):
+        self._count_i2c(len(data))
+        if self._device is None: return 0x00
+        self._device.write(data)
+        return 0x01
+
+    def bus_read(self, count):
+        self._count_i2c(count)
+        if self._device is None: return b"\xff" * count
+        return self._device.read(count)
+
+    def bus_stop(self):
+        if self._device is not None: self._device.stop()
+        self._device = None
+
+    def _count_i2c(self, count):
+        self.i2c_bytes += count
+        self.ser._cost += count * self.latency.i2c_byte
+
+
+if __name__ == '__main__':
+    from matrix import HT16K33
+
+    i2c_bus = FakeI2CDriver()
+    led = HT16K33(i2c_bus)
+    i2c_bus.reset_stats()
+    led.scroll_text("This is a test of scrolling...", speed=0)
+    print(f"Scroll: {i2c_bus.transactions} transactions, {i2c_bus.i2c_bytes} bus bytes, "
+          f"{i2c_bus.round_trips} round trips, {i2c_bus.elapsed * 1000:.1f}ms simulated")
+
+    # Check a render end to end: the bars must rise from the bottom row (bit 0)
+    led.bar_graph([25, 50, 100, 12.5]).update()
+    ram = i2c_bus.devices[0x70].ram
+    columns = bytes(ram[r & 0x0F] for r in HT16K33.ROW_MAP)
+    expected = bytes([0x03] * 3 + [0] + [0x0F] * 3 + [0] + [0xFF] * 3 + [0] + [0x01] * 3 + [0])
+    assert columns == expected, f"bar_graph rendered {columns.hex()}, expected {expected.hex()}"
+    print("Bar graph: rendered as expected")
+
+    # Check auto-ranging settles where the counts at the shorter integration time
+    # come in just under the driver's prediction, rather than stepping forever
+    from tsl2561 import TSL2561
+    for broadband in (2925, 2930, 2940):
+        i2c_bus = FakeI2CDriver(devices={0x39: TSL2561Model(broadband, broadband // 4)})
+        sensor = TSL2561(i2c_bus)
+        i2c_bus.reset_stats()
+        sensor.get_lux()
+        assert i2c_bus.transactions <= 2 * len(TSL2561.TSL_RANGES), \
+            f"auto-ranging at {broadband} counts took {i2c_bus.transactions} transactions"
+    print("Auto-ranging: settled at every boundary")
@@ -0,0 +1,186 @@
+"""
+Transaction coalescing for the I2CDriver Mini (https://i2cdriver.com/mini.html)
+"""
+
+from contextlib import contextmanager
+
+
+class BatchError(IOError):
+    """
+    Raised when a flushed batch contains transactions that were not acknowledged.
+    'results' holds an (address, acknowledged) tuple for every transaction sent
+    """
+
+    def __init__(self, results):
+        failed = ", ".join([f"0x{addr:02X}" for addr, ok in results if not ok])
+        super().__init__(f"I2C transactions to {failed} were not acknowledged")
+        self.results = results
+
+
+class BatchedI2C:
+    """
+    A wrapper for an i2cdriver.I2CDriver that can be passed to any of the drivers
+    in place of the bus itself. Outside a batch() block every call goes straight
+    through; inside one, write transactions are queued and sent together when the
+    block ends or when a read needs the bus. The I2CDriver's command bytes for the
+    whole batch are pipelined over the serial link, so it costs one round trip
+    rather than one per start() and write()
+    """
+
+    # I2CDriver serial protocol commands
+    CMD_START = 0x73
+    CMD_STOP = 0x70
+    CMD_WRITE = 0xC0
+    MAX_WRITE = 64
+
+    def __init__(self, i2c):
+        self.i2c = i2c
+        self.results = []
+        self._depth = 0
+        self._queue = []
+        self._current = None
+        self._on_failure = []
+
+    @contextmanager
+    def batch(self):
+        """
+        Queue writes until the outermost batch() block ends. If the block raises,
+        the queued writes are dropped rather than sent half-finished
+        """
+        self._depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._depth -= 1
+            self._queue = []
+            self._current = None
+            self._failed()
+            raise
+        self._depth -= 1
+        if self._depth == 0: self.flush()
+
+    def flush(self):
+        """
+        Send all the queued transactions and return an (address, acknowledged)
+        tuple for each of them. Raises BatchError if any were not acknowledged
+        """
+        queued = self._queue
+        self._queue = []
+        if len(queued) == 0: return []
+
+        ser = getattr(self.i2c, "ser", None)
+        try:
+            if ser is None:
+                results = self._replay(queued)
+            else:
+                results = self._pipeline(ser, queued)
+        except BaseException:
+            self._failed()
+            raise
+
+        self.results = results
+        for addr, ok in results:
+            if not ok:
+                self._failed()
+                raise BatchError(results)
+        self._on_failure = []
+        return results
+
+    def on_failure(self, callback):
+        """
+        Have 'callback' called, with no arguments, if the writes queued so far
+        never reach the bus: the batch is dropped, or its flush fails. Drivers
+        that track what their device holds use this to know it is out of date.
+        Outside a batch, writes are sent at once and this does nothing
+        """
+        if self._depth > 0 and callback not in self._on_failure: self._on_failure.append(callback)
+
+    def start(self, dev, rw):
+        if self._depth == 0 or rw == 1:
+            self.flush()
+            return self.i2c.start(dev, rw)
+        self._current = (dev, [])
+        return True
+
+    def write(self, bb):
+        if self._current is None: return self.i2c.write(bb)
+        # Take a copy, as callers may reuse their buffer before the flush
+        self._current[1].append(bytes(bb))
+        return True
+
+    def stop(self):
+        if self._current is None:
+            self.i2c.stop()
+        else:
+            self._queue.append(self._current)
+            self._current = None
+
+    def read(self, l):
+        return self.i2c.read(l)
+
+    def regrd(self, dev, reg, fmt="B"):
+        self.flush()
+        return self.i2c.regrd(dev, reg, fmt)
+
+    def regwr(self, dev, reg, vv):
+        if self._depth == 0: return self.i2c.regwr(dev, reg, vv)
+        if isinstance(vv, int): vv = [vv]
+        self._queue.append((dev, [bytes([reg]) + bytes(vv)]))
+        return True
+
+    def scan(self, silent=False):
+        self.flush()
+        return self.i2c.scan(silent)
+
+    def __getattr__(self, name):
+        return getattr(self.i2c, name)
+
+    def _failed(self):
+        callbacks = self._on_failure
+        self._on_failure = []
+        for callback in callbacks: callback()
+
+    def _pipeline(self, ser, queued):
+        """
+        Send every transaction in one serial write, then collect the acknowledgement
+        bytes: one for each start and one for each write of up to 64 bytes
+        """
+        cmds = bytearray()
+        counts = []
+        for dev, chunks in queued:
+            cmds += bytes((self.CMD_START, dev << 1))
+            count = 1
+            for chunk in chunks:
+                for i in range(0, len(chunk), self.MAX_WRITE):
+                    sub = chunk[i:i + self.MAX_WRITE]
+                    cmds.append(self.CMD_WRITE + len(sub) - 1)
+                    cmds += sub
+                    count += 1
+            cmds.append(self.CMD_STOP)
+            counts.append(count)
+
+        ser.write(cmds)
+        acks = ser.read(sum(counts))
+
+        results = []
+        index = 0
+        for (dev, chunks), count in zip(queued, counts):
+            # Bit 0 is the ACK; bit 1 flags a bus timeout
+            replies = acks[index:index + count]
+            ok = len(replies) == count and all((a & 3) == 1 for a in replies)
+            results.append((dev, ok))
+            index += count
+        return results
+
+    def _replay(self, queued):
+        """
+        Send the transactions one by one, for buses that have no serial link
+        """
+        results = []
+        for dev, chunks in queued:
+            ok = self.i2c.start(dev, 0)
+            for chunk in chunks:
+                if ok: ok = self.i2c.write(chunk)
+            self.i2c.stop()
+            results.append((dev, ok))
+        return results
@@ -0,0 +1,206 @@
+"""
+Bus instrumentation for the I2CDriver Mini (https://i2cdriver.com/mini.html)
+"""
+
+import os
+import sys
+import json
+import time
+import bisect
+import struct
+import threading
+
+
+class OpStats:
+    """
+    Counts, bytes and a latency histogram for one operation type on one device
+    """
+
+    __slots__ = ("count", "bytes", "time", "buckets")
+
+    def __init__(self, size):
+        self.count = 0
+        self.bytes = 0
+        self.time = 0.0
+        self.buckets = [0] * size
+
+
+class InstrumentedI2C:
+    """
+    A wrapper for an i2cdriver.I2CDriver (or a BatchedI2C) that records, for each
+    device address and each operation, how many calls were made, how many bytes
+    they moved and how long they took. Latencies are counted into fixed buckets
+    whose upper bounds are listed in BUCKETS (seconds). A start()...stop() sequence
+    is recorded as one 'write' or 'read' transaction, and byte counts include the
+    address bytes. Wrap the bus nearest the drivers. When disabled, the bus
+    methods are the wrapped object's own, so there is no per-call overhead
+    """
+
+    BUCKETS = [0.00005 * (2 ** i) for i in range(0, 14)]
+    OPS = ("start", "write", "read", "stop", "regrd", "regwr", "scan")
+
+    def __init__(self, i2c, enabled=True):
+        self.i2c = i2c
+        self.stats = {}
+        self._since = time.monotonic()
+        self._txn = None
+        self._timer = None
+        if enabled is True:
+            self.enable()
+        else:
+            self.disable()
+
+    def enable(self):
+        for name in self.OPS: self.__dict__.pop(name, None)
+        self.enabled = True
+
+    def disable(self):
+        for name in self.OPS: setattr(self, name, getattr(self.i2c, name))
+        self.enabled = False
+        self._txn = None
+
+    def reset(self):
+        self.stats = {}
+        self._since = time.monotonic()
+
+    def start(self, dev, rw):
+        begun = time.perf_counter()
+        ack = self.i2c.start(dev, rw)
+        if self._txn is None:
+            self._txn = [dev, "read" if rw == 1 else "write", begun, 1]
+        else:
+            # A repeated start extends the transaction in progress
+            self._txn[3] += 1
+        return ack
+
+    def write(self, bb):
+        ack = self.i2c.write(bb)
+        if self._txn is not None: self._txn[3] += len(bb)
+        return ack
+
+    def read(self, l):
+        data = self.i2c.read(l)
+        if self._txn is not None:
+            self._txn[1] = "read"
+            self._txn[3] += len(data)
+        return data
+
+    def stop(self):
+        self.i2c.stop()
+        if self._txn is not None:
+            dev, op, begun, count = self._txn
+            self._txn = None
+            self._record(dev, op, count, time.perf_counter() - begun)
+
+    def regrd(self, dev, reg, fmt="B"):
+        begun = time.perf_counter()
+        result = self.i2c.regrd(dev, reg, fmt)
+        # Count the address byte twice: the register is written, then read back
+        count = fmt if isinstance(fmt, int) else struct.calcsize(fmt)
+        self._record(dev, "regrd", count + 3, time.perf_counter() - begun)
+        return result
+
+    def regwr(self, dev, reg, vv):
+        begun = time.perf_counter()
+        ack = self.i2c.regwr(dev, reg, vv)
+        count = 1 if isinstance(vv, int) else len(vv)
+        self._record(dev, "regwr", count + 2, time.perf_counter() - begun)
+        return ack
+
+    def scan(self, silent=False):
+        begun = time.perf_counter()
+        found = self.i2c.scan(silent)
+        self._record(0, "scan", 0, time.perf_counter() - begun)
+        return found
+
+    def __getattr__(self, name):
+        return getattr(self.i2c, name)
+
+    def snapshot(self):
+        """
+        Return the statistics as a dictionary keyed by device address ('0x70')
+        and operation name, along with the number of seconds they cover
+        """
+        elapsed = time.monotonic() - self._since
+        devices = {}
+        for (dev, op), entry in sorted(self.stats.items()):
+            devices.setdefault(f"0x{dev:02X}", {})[op] = {
+                "count": entry.count,
+                "bytes": entry.bytes,
+                "rate": entry.count / elapsed if elapsed > 0 else 0.0,
+                "mean": entry.time / entry.count if entry.count > 0 else 0.0,
+                "buckets": list(entry.buckets)}
+        return {"elapsed": elapsed, "buckets": self.BUCKETS, "devices": devices}
+
+    def dump(self, fmt="text"):
+        """
+        Return the statistics as JSON or as a human-readable table
+        """
+        snap = self.snapshot()
+        if fmt == "json": return json.dumps(snap)
+
+        lines = [f"I2C statistics over {snap['elapsed']:.1f}s"]
+        for dev, ops in snap["devices"].items():
+            for op, entry in ops.items():
+                lines.append(f"{dev} {op:<6} {entry['count']:>8} ops {entry['bytes']:>10} bytes "
+                             f"{entry['rate']:>9.1f}/s  mean {entry['mean'] * 1000:.3f}ms  "
+                             f"p99 <{self._percentile(entry['buckets'], 0.99) * 1000:.2f}ms")
+        return "\n".join(lines)
+
+    def start_reporting(self, interval=10.0, fmt="text", stream=None):
+        """
+        Write dump() output to 'stream' (default stderr) every 'interval' seconds
+        from a background thread
+        """
+        if stream is None: stream = sys.stderr
+
+        def report():
+            stream.write(self.dump(fmt) + "\n")
+            stream.flush()
+            self._timer = threading.Timer(interval, report)
+            self._timer.daemon = True
+            self._timer.start()
+
+        self._timer = threading.Timer(interval, report)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def stop_reporting(self):
+        if self._timer is not None: self._timer.cancel()
+        self._timer = None
+
+    def _record(self, dev, op, count, latency):
+        key = (dev, op)
+        entry = self.stats.get(key)
+        if entry is None:
+            entry = OpStats(len(self.BUCKETS) + 1)
+            self.stats[key] = entry
+        entry.count += 1
+        entry.bytes += count
+        entry.time += latency
+        entry.buckets[bisect.bisect_left(self.BUCKETS, latency)] += 1
+
+    def _percentile(self, buckets, fraction):
+        """
+        Return the upper bound of the bucket holding the given fraction of samples
+        """
+        target = sum(buckets) * fraction
+        total = 0
+        for i, count in enumerate(buckets):
+            total += count
+            if total >= target and count > 0:
+                return self.BUCKETS[i] if i < len(self.BUCKETS) else float("inf")
+        return 0.0
+
+
+def from_env(i2c):
+    """
+    Wrap the bus in an InstrumentedI2C that reports periodically if the I2C_STATS
+    environment variable is set to 'text' or 'json'; otherwise return it unchanged.
+    I2C_STATS_INTERVAL sets the reporting period in seconds (default 10)
+    """
+    fmt = os.environ.get("I2C_STATS")
+    if fmt not in ("text", "json"): return i2c
+    instrumented = InstrumentedI2C(i2c)
+    instrumented.start_reporting(float(os.environ.get("I2C_STATS_INTERVAL", "10")), fmt)
+    return instrumented
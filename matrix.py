@@ -4,7 +4,17 @@ Demo for the I2CDriver Mini (https:#i2cdriver.com/mini.html)
 
 import time
 import random
+import itertools
+import queue
+from collections import OrderedDict
 import i2cdriver
+import i2cstats
+try:
+    import numpy as np
+except ImportError:
+    np = None
+from i2cbatch import BatchedI2C
+from scheduler import FrameScheduler
 
 
 class HT16K33:
@@ -25,6 +35,21 @@ class HT16K33:
 
     DISPLAY_WIDTH = 16
     DISPLAY_HEIGHT = 8
+    BLANK = bytes(32)
+
+    # The buffer index of each display column, as calculated by _get_row()
+    ROW_MAP = [16, 18, 20, 22, 24, 26, 28, 30, 17, 19, 21, 23, 25, 27, 29, 31]
+
+    # Byte translation table used by invert()
+    INVERT = bytes(range(255, -1, -1))
+
+    # Changed bytes separated by no more than this many unchanged bytes
+    # are sent as a single RAM window by update()
+    DIRTY_MERGE_GAP = 3
+    DIRTY_MAX_WINDOWS = 3
+
+    # How many rendered lines of text get_strip() keeps
+    STRIP_CACHE_SIZE = 8
 
     CHARSET = [
         b"\x00\x00",              # space - Ascii 32
@@ -133,7 +158,23 @@ class HT16K33:
 
         self.i2c = i2c
         self.addr = address
-        self.buffer = bytearray(32)
+        # The transmit buffer holds the RAM address byte followed by the
+        # framebuffer, so update() can write it out without copying
+        self._tx = bytearray(33)
+        self._txview = memoryview(self._tx)
+        self.buffer = self._txview[1:]
+        self.bytes_saved = 0
+        self.bytes_sent = 0
+        self._sent = bytearray(32)
+        self._synced = False
+        self._strips = OrderedDict()
+        self._shift_tables = {}
+
+        # Scrolling ring buffer: every column is stored twice, so the 16 columns
+        # on show are always one contiguous slice starting at the head
+        self._ring = bytearray(32)
+        self._ringview = memoryview(self._ring)
+        self._head = 0
 
         # Initialize display: clock on, display on
         self.send_command(self.HT16K33_MATRIX_SYSTEM_ON)
@@ -156,65 +197,321 @@ class HT16K33:
         self.send_command(0x81 | value)
 
     def clear(self):
-        for i in range(0, 32):
-            self.buffer[i] = 0x00
+        self.buffer[:] = self.BLANK
         return self
 
     def plot(self, x, y, colour=1):
+        """
+        Set (colour 1) or clear (colour 0) the pixel at (x, y). As with all the
+        drawing methods, x counts from the left and y from the bottom row up
+        """
         if (0 <= x < self.DISPLAY_WIDTH) and (0 <= y < self.DISPLAY_HEIGHT):
-            x = self._get_row(x)
-            v = self.buffer[x]
-            if colour == 1:
-                if v & (1 << y) == 0: v = v | (1 << y)
-            else:
-                if v & (1 << y) != 0: v = v & ~(1 << y)
-            self.buffer[x] = v
+            self._apply_mask(x, 1 << y, colour)
             return self
         return None
 
+    def blit(self, pixels):
+        """
+        Load the whole display in one step from an 8 x 16 (rows x columns) NumPy
+        array of booleans or 0/1 values, an image with row 0 at the top.
+        Requires NumPy
+        """
+        frames = self.render_frames(pixels)
+        if frames is None or len(frames) != 1: return None
+        self.buffer[:] = frames[0]
+        return self
+
+    @classmethod
+    def render_frames(cls, pixels):
+        """
+        Pack an 8 x 16 array, or an N x 8 x 16 stack of them, into RAM images ready
+        to send: an N x 32 uint8 array whose rows can be passed to play(). Row 0
+        of each array is the top of the display. Requires NumPy
+        """
+        if np is None: raise ImportError("render_frames() requires NumPy")
+        stack = np.asarray(pixels)
+        if stack.ndim == 2: stack = stack[np.newaxis]
+        if stack.ndim != 3 or stack.shape[1:] != (cls.DISPLAY_HEIGHT, cls.DISPLAY_WIDTH): return None
+
+        # Bit 7 of a column byte is the top row, so array row 0 becomes bit 7
+        columns = np.packbits(stack != 0, axis=1, bitorder="big")[:, 0, :]
+        frames = np.zeros((len(stack), 32), dtype=np.uint8)
+        frames[:, cls.ROW_MAP] = columns
+        return frames
+
     def set_char(self, the_char, row):
         if the_char is None or len(the_char) != 1: return None
         if 0 <= row < self.DISPLAY_WIDTH:
-            glyph = self.CHARSET[ord(the_char[0]) - 32]
-            for j in range(0, len(glyph)):
-                col = glyph[j]
-                for k in range(0, 8):
-                    if row < self.DISPLAY_WIDTH:
-                        r = self._get_row(row)
-                        v = self.buffer[r]
-                        if col & (1 << k) != 0: v = v | (1 << k)
-                        self.buffer[r] = v
-                row += 1
-            return self
+            return self.sprite(row, 0, self.CHARSET[ord(the_char[0]) - 32])
         return None
 
+    def line(self, x0, y0, x1, y1, colour=1):
+        """
+        Draw a straight line between two points. The pixels are gathered into one
+        bit mask per column, and each column is then updated once
+        """
+        masks = bytearray(self.DISPLAY_WIDTH)
+        dx = abs(x1 - x0)
+        dy = -abs(y1 - y0)
+        sx = 1 if x0 < x1 else -1
+        sy = 1 if y0 < y1 else -1
+        err = dx + dy
+        while True:
+            if (0 <= x0 < self.DISPLAY_WIDTH) and (0 <= y0 < self.DISPLAY_HEIGHT):
+                masks[x0] |= 1 << y0
+            if x0 == x1 and y0 == y1: break
+            e2 = err << 1
+            if e2 >= dy:
+                err += dy
+                x0 += sx
+            if e2 <= dx:
+                err += dx
+                y0 += sy
+        for x in range(0, self.DISPLAY_WIDTH):
+            if masks[x] != 0: self._apply_mask(x, masks[x], colour)
+        return self
+
+    def rect(self, x, y, width, height, colour=1, fill=False):
+        """
+        Draw a rectangle, filled or outlined, with its bottom-left corner at (x, y)
+        """
+        if width < 1 or height < 1: return None
+        span = self._span_mask(y, y + height - 1)
+        edges = self._span_mask(y, y) | self._span_mask(y + height - 1, y + height - 1)
+        for col in range(max(x, 0), min(x + width, self.DISPLAY_WIDTH)):
+            if fill is True or col == x or col == x + width - 1:
+                self._apply_mask(col, span, colour)
+            else:
+                self._apply_mask(col, edges, colour)
+        return self
+
+    def sprite(self, x, y, bitmap, mask=None):
+        """
+        Draw a bitmap, given as column bytes in the same form as CHARSET's glyphs
+        (bit 0 at the bottom), with its bottom-left corner at (x, y), so 'y' raises
+        it from the bottom row. Without a mask, unset bits are
+        transparent; with one (also column bytes), the bitmap replaces whatever is
+        under the mask's set bits
+        """
+        for i in range(0, len(bitmap)):
+            col = x + i
+            if not 0 <= col < self.DISPLAY_WIDTH: continue
+            bits = bitmap[i] << y if y >= 0 else bitmap[i] >> -y
+            r = self.ROW_MAP[col]
+            if mask is None:
+                self.buffer[r] |= bits & 0xFF
+            else:
+                cover = (mask[i] << y if y >= 0 else mask[i] >> -y) & 0xFF
+                self.buffer[r] = (self.buffer[r] & ~cover) | (bits & cover)
+        return self
+
+    def invert(self):
+        """
+        Turn every lit pixel off and every unlit pixel on
+        """
+        self.buffer[16:32] = self.buffer[16:32].tobytes().translate(self.INVERT)
+        return self
+
+    def shift(self, dx=0, dy=0, wrap=False):
+        """
+        Move the whole image 'dx' columns right (negative: left) and 'dy' pixels
+        up (negative: down). Pixels moved off one edge reappear at the opposite
+        edge if 'wrap' is true; otherwise they are lost
+        """
+        cols = self.get_columns()
+        width = self.DISPLAY_WIDTH
+        if dx != 0:
+            if wrap is True:
+                dx %= width
+                cols = cols[width - dx:] + cols[:width - dx]
+            elif dx > 0:
+                cols = bytes(min(dx, width)) + cols[:max(width - dx, 0)]
+            else:
+                cols = cols[min(-dx, width):] + bytes(min(-dx, width))
+        if dy != 0:
+            cols = cols.translate(self._get_shift_table(dy, wrap))
+        self.set_columns(cols)
+        return self
+
+    def bar_graph(self, values, maximum=100):
+        """
+        Draw a bar for each value, rising from the bottom edge, with the display
+        width shared between them (up to 16 bars). Bars two or more columns wide
+        are separated by a blank column
+        """
+        count = min(len(values), self.DISPLAY_WIDTH)
+        if count == 0 or maximum <= 0: return None
+        width = self.DISPLAY_WIDTH // count
+        cols = bytearray(self.DISPLAY_WIDTH)
+        for i in range(0, count):
+            height = int(round(min(max(values[i], 0), maximum) * self.DISPLAY_HEIGHT / maximum))
+            # Bit 0 is the bottom row, so the bar fills the low bits
+            bar = (1 << height) - 1
+            for x in range(i * width, (i + 1) * width - (1 if width > 1 else 0)): cols[x] = bar
+        self.set_columns(cols)
+        return self
+
+    def get_columns(self):
+        """
+        Return the display's 16 column bytes, left to right
+        """
+        return self.buffer[16:32:2].tobytes() + self.buffer[17:32:2].tobytes()
+
+    def set_columns(self, cols):
+        """
+        Load the display from 16 column bytes, left to right
+        """
+        self.buffer[16:32:2] = cols[0:8]
+        self.buffer[17:32:2] = cols[8:16]
+        return self
+
+    def _apply_mask(self, x, mask, colour):
+        """
+        Set (colour 1) or clear (colour 0) the masked bits of column x
+        """
+        r = self.ROW_MAP[x]
+        if colour == 1:
+            self.buffer[r] |= mask
+        else:
+            self.buffer[r] &= ~mask & 0xFF
+
+    def _span_mask(self, y0, y1):
+        """
+        Return a column mask with bits y0 to y1 (inclusive) set, clipped to the display
+        """
+        y0 = max(y0, 0)
+        y1 = min(y1, self.DISPLAY_HEIGHT - 1)
+        if y1 < y0: return 0
+        return ((1 << (y1 - y0 + 1)) - 1) << y0
+
+    def _get_shift_table(self, dy, wrap):
+        """
+        Return a byte translation table that moves every column's bits by dy
+        """
+        key = (dy, wrap)
+        table = self._shift_tables.get(key)
+        if table is None:
+            if wrap is True:
+                dy %= 8
+                table = bytes([((b << dy) | (b >> (8 - dy))) & 0xFF for b in range(0, 256)])
+            elif dy > 0:
+                table = bytes([(b << dy) & 0xFF for b in range(0, 256)])
+            else:
+                table = bytes([b >> -dy for b in range(0, 256)])
+            self._shift_tables[key] = table
+        return table
+
     def scroll_text(self, the_line, speed=0.1):
         if the_line is None or len(the_line) == 0: return None
-        the_line += "        "
-        length = 0
-        for i in range(0, len(the_line)):
-            glyph = self.CHARSET[ord(the_line[i]) - 32]
-            length += len(glyph) + 1
-        buf = bytearray(length * 8)
+        strip = self.get_strip(the_line + "        ")
+        timer = FrameScheduler(period=speed)
+        sent, cpu = self.bytes_sent, time.process_time()
+        for frame in timer.run(strip.frames):
+            self.buffer[16:32] = frame
+            self.update()
+        return self._get_scroll_stats(timer, sent, cpu)
+
+    def scroll_stream(self, source, speed=0.1):
+        """
+        Scroll text from any iterable of characters, eg. a generator or a TextFeed.
+        Glyph columns are produced only as they are needed, so memory use is the
+        same however long the text, and text can keep arriving while scrolling
+        """
+        if source is None: return None
+        self.scroll_reset()
+        timer = FrameScheduler(period=speed)
+        sent, cpu = self.bytes_sent, time.process_time()
+        for col in timer.run(self._stream_columns(source)):
+            self.scroll_push(col)
+            self.update()
+        return self._get_scroll_stats(timer, sent, cpu)
+
+    def scroll_push(self, col):
+        """
+        Move the image one column left and bring in 'col' at the right. Only one
+        column is stored in the ring buffer and the head index moved; the buffer
+        is then refreshed from the ring with two slice copies. Call update() to
+        send it: as the scroll leaves bytes 0-15 alone, at most the 16 bytes of
+        display RAM are written, not the full 32-byte buffer
+        """
+        head = self._head
+        self._ring[head] = col
+        self._ring[head + 16] = col
+        head = (head + 1) & 0x0F
+        self._head = head
+        self.set_columns(self._ringview[head:head + 16])
+        return self
+
+    def scroll_reset(self, cols=None):
+        """
+        Load the scrolling ring buffer with 16 column bytes (default: blank)
+        """
+        if cols is None: cols = self.BLANK[0:16]
+        self._ring[0:16] = cols
+        self._ring[16:32] = cols
+        self._head = 0
+        return self
+
+    def _get_scroll_stats(self, timer, sent, cpu):
+        """
+        Add per-step CPU time and bus bytes to a scroll's timing statistics,
+        alongside the bytes per step that full-buffer writes would need
+        """
+        stats = timer.stats()
+        steps = max(stats["frames"], 1)
+        stats["cpu_per_step"] = (time.process_time() - cpu) / steps
+        stats["bytes_per_step"] = (self.bytes_sent - sent) / steps
+        stats["full_bytes_per_step"] = len(self.buffer) + 1
+        return stats
+
+    def _stream_columns(self, source):
+        """
+        Yield the glyph columns for each character taken from 'source', followed
+        by enough blank columns to scroll the last character off the display
+        """
+        for the_char in source:
+            code = ord(the_char) - 32
+            if not 0 <= code < len(self.CHARSET): code = 0
+            yield from self.CHARSET[code]
+            yield 0x00
+        for i in range(0, self.DISPLAY_WIDTH):
+            yield 0x00
+
+    def get_strip(self, the_line):
+        """
+        Return the line of text as a TextStrip, rendering it only if it is
+        not among the most recently used lines
+        """
+        strip = self._strips.get(the_line)
+        if strip is not None:
+            self._strips.move_to_end(the_line)
+            return strip
 
-        row = 0
+        columns = bytearray()
         for i in range(0, len(the_line)):
-            glyph = self.CHARSET[ord(the_line[i]) - 32]
-            for j in range(0, len(glyph)):
-                buf[row] = glyph[j]
-                row += 1
-            row += 1
-
-        row = 0
-        cur = 0
-        while row < length:
-            for i in range(0, 16):
-                self.buffer[self._get_row(i)] = buf[cur];
-                cur += 1
+            columns += self.CHARSET[ord(the_line[i]) - 32]
+            columns.append(0x00)
+        strip = TextStrip(columns)
+
+        self._strips[the_line] = strip
+        if len(self._strips) > self.STRIP_CACHE_SIZE:
+            self._strips.popitem(last=False)
+        return strip
+
+    def play(self, frames, fps=30, drop=True):
+        """
+        Show a sequence of frames at a fixed rate and return the timing statistics.
+        Each frame is either a complete buffer image or a function that is passed
+        the LED object to draw on
+        """
+        timer = FrameScheduler(fps, drop)
+        for frame in timer.run(frames):
+            if callable(frame):
+                frame(self)
+            else:
+                self.buffer[:] = frame
             self.update()
-            time.sleep(speed)
-            row += 1
-            cur -= 15
+        return timer.stats()
 
     def send_command(self, byte):
         """
@@ -224,16 +521,71 @@ class HT16K33:
         self.i2c.write([byte])
         self.i2c.stop()
 
-    def update(self):
+    def update(self, full=False):
+        """
+        Write the buffer to the LED. Only the RAM windows that have changed since
+        the last write are sent, unless 'full' is True (eg. after a bus glitch).
+        The number of bytes this saved over a full write is left in 'bytes_saved',
+        and 'bytes_sent' keeps a running total
+        """
+        size = len(self.buffer)
+        if full is True or self._synced is False:
+            windows = [(0, size)]
+        elif self.buffer == self._sent:
+            windows = []
+        else:
+            windows = self._get_dirty_windows()
+
+        sent = 0
+        for start, end in windows:
+            # The byte in front of each window is borrowed to carry its RAM
+            # address. The HT16K33 has 16 bytes of RAM and its address pointer
+            # wraps, so buffer bytes 16-31 land on RAM addresses 0x00-0x0F.
+            # The byte goes back even if the bus fails, so no pixel is lost
+            held = self._tx[start]
+            self._tx[start] = start & 0x0F
+            try:
+                self.i2c.start(self.addr, 0)
+                self.i2c.write(self._txview[start:end + 1])
+                self.i2c.stop()
+            finally:
+                self._tx[start] = held
+            sent += end - start + 1
+
+        self._sent[:] = self.buffer
+        self._synced = True
+        self.bytes_saved = size + 1 - sent
+        self.bytes_sent += sent
+
+        # Inside a batch the writes are only queued: if they never arrive, the
+        # next update has to send the whole buffer rather than a diff
+        if sent > 0:
+            on_failure = getattr(self.i2c, "on_failure", None)
+            if on_failure is not None: on_failure(self._set_unsynced)
+
+    def _set_unsynced(self):
+        self._synced = False
+
+    def _get_dirty_windows(self):
         """
-        Write the buffer to the LED
+        Return the (start, end) buffer ranges that differ from the last write
         """
-        bfr = [0x00]
+        windows = []
+        start = end = -1
         for i in range(0, len(self.buffer)):
-            bfr.append(self.buffer[i])
-        self.i2c.start(self.addr, 0)
-        self.i2c.write(bfr)
-        self.i2c.stop()
+            if self.buffer[i] != self._sent[i]:
+                if start < 0:
+                    start = i
+                elif i - end > self.DIRTY_MERGE_GAP:
+                    windows.append((start, end))
+                    start = i
+                end = i + 1
+        if start >= 0: windows.append((start, end))
+
+        # Too many small writes cost more in round trips than one large one
+        if len(windows) > self.DIRTY_MAX_WINDOWS:
+            windows = [(windows[0][0], windows[-1][1])]
+        return windows
 
     def _get_row(self, x):
         if x < 8:
@@ -243,10 +595,66 @@ class HT16K33:
         return x
 
 
+class TextStrip:
+    """
+    A line of text pre-rendered as glyph columns, plus one ready-to-copy frame
+    per scroll position. Each frame is the 16-byte, RAM-ordered image that goes
+    into HT16K33.buffer[16:32]
+    """
+
+    def __init__(self, columns):
+        self.columns = bytes(columns)
+        self.frames = []
+
+        padded = self.columns + bytes(15)
+        for i in range(0, len(self.columns)):
+            # Columns 0-7 occupy the even RAM bytes, columns 8-15 the odd ones
+            frame = bytearray(16)
+            frame[0::2] = padded[i:i + 8]
+            frame[1::2] = padded[i + 8:i + 16]
+            self.frames.append(bytes(frame))
+
+    def __len__(self):
+        return len(self.frames)
+
+
+class TextFeed:
+    """
+    A thread-safe character source for HT16K33.scroll_stream(). Other threads
+    add() text while the display scrolls; close() ends the stream once all the
+    added text has been shown. If 'idle' is a character, it is scrolled whenever
+    no text is waiting, rather than pausing the display
+    """
+
+    def __init__(self, idle=None):
+        self.idle = idle
+        self._queue = queue.Queue()
+
+    def add(self, text):
+        self._queue.put(text)
+        return self
+
+    def close(self):
+        self._queue.put(None)
+
+    def __iter__(self):
+        while True:
+            if self.idle is None:
+                text = self._queue.get()
+            else:
+                try:
+                    text = self._queue.get_nowait()
+                except queue.Empty:
+                    text = self.idle
+            if text is None: return
+            yield from text
+
 
 if __name__ == '__main__':
-    i2c_bus = i2cdriver.I2CDriver("/dev/cu.usbserial-DO029IEZ")
-    led = HT16K33(i2c_bus)
+    # Set I2C_STATS=text or I2C_STATS=json to report bus usage
+    i2c_bus = i2cstats.from_env(BatchedI2C(i2cdriver.I2CDriver("/dev/cu.usbserial-DO029IEZ")))
+    with i2c_bus.batch():
+        led = HT16K33(i2c_bus)
     led.update()
 
     led.set_char("*", 5).update()
@@ -261,9 +669,9 @@ if __name__ == '__main__':
     led.scroll_text("This is a test of scrolling...")
 
     count = 0
-    while True:
-        # Get the CPU utilization and calculate
-        # the Binary-Coded Decimal (BCD) form
+    timer = FrameScheduler(100)
+    for frame in timer.run(itertools.count()):
+        # Bounce a pixel around the display
         led.clear().plot(x, y).update()
 
         x += dx
@@ -286,8 +694,5 @@ if __name__ == '__main__':
             count += 1
             if count > 4: break
 
-        # Pause for breath
-        time.sleep(0.01)
-
     time.sleep(0.01)
     led.clear().update()
@@ -3,8 +3,14 @@ Temperature readout using the I2CDriver Mini (https://i2cdriver.com/mini.html)
 and an MCP9808 digital temperature sensor (https://www.adafruit.com/product/1782)
 """
 
+import sys
 import time
+import struct
+import itertools
+from array import array
 import i2cdriver
+import i2cstats
+from scheduler import FrameScheduler
 
 
 class MCP9808:
@@ -13,9 +19,27 @@ class MCP9808:
     """
 
     MCP_CONFIG_REG = 0x01
+    MCP_UPPER_TEMP_REG = 0x02
+    MCP_LOWER_TEMP_REG = 0x03
+    MCP_CRIT_TEMP_REG = 0x04
     MCP_AMBIENT_TEMP_REG = 0x05
     MCP_MANUF_ID_REG = 0x06
     MCP_DEVICE_ID_REG = 0x07
+    MCP_RESOLUTION_REG = 0x08
+
+    # Resolution register settings: (degrees Celsius per step, conversion time in seconds)
+    MCP_RESOLUTIONS = [(0.5, 0.03), (0.25, 0.065), (0.125, 0.13), (0.0625, 0.25)]
+
+    # Configuration register bits
+    MCP_CONFIG_ALERT_MODE = 0x0001
+    MCP_CONFIG_ALERT_POLARITY = 0x0002
+    MCP_CONFIG_ALERT_CONTROL = 0x0008
+    MCP_CONFIG_INT_CLEAR = 0x0020
+
+    # Ambient temperature register flags: T >= T_CRIT, T > T_UPPER, T < T_LOWER
+    MCP_FLAG_CRIT = 0x04
+    MCP_FLAG_UPPER = 0x02
+    MCP_FLAG_LOWER = 0x01
 
     def __init__(self, i2c, address=0x18):
         """
@@ -26,23 +50,110 @@ class MCP9808:
         self.i2c = i2c
         self.addr = address
         self.alert = False
+        self.callback = None
+        self.resolution = 3
+        self._config = 0x0000
+
+    def set_resolution(self, resolution):
+        """
+        Set the resolution, 0 (0.5 degree, 30ms per conversion) to 3 (0.0625 degree,
+        250ms per conversion, the power-on default). See MCP_RESOLUTIONS
+        """
+        if not 0 <= resolution < len(self.MCP_RESOLUTIONS): return None
+        self.i2c.regwr(self.addr, self.MCP_RESOLUTION_REG, resolution)
+        self.resolution = resolution
+        return self
+
+    def set_alert(self, lower, upper, critical=None, callback=None, interrupt=False, active_high=False):
+        """
+        Program the sensor's alert window, in degrees Celsius (to 0.25 degree), and
+        enable its ALERT output. 'critical' defaults to 'upper'. In comparator
+        mode the alert clears when the temperature returns to the window; in
+        interrupt mode it holds until clear_alert() is called. 'callback' is
+        called with the flags (see check_alert()) whenever an alert is raised
+        """
+        if critical is None: critical = upper
+        for reg, limit in ((self.MCP_UPPER_TEMP_REG, upper),
+                           (self.MCP_LOWER_TEMP_REG, lower),
+                           (self.MCP_CRIT_TEMP_REG, critical)):
+            value = (int(round(limit * 4)) << 2) & 0x1FFC
+            self.i2c.regwr(self.addr, reg, struct.pack(">H", value))
+
+        self._config = self.MCP_CONFIG_ALERT_CONTROL
+        if interrupt: self._config |= self.MCP_CONFIG_ALERT_MODE
+        if active_high: self._config |= self.MCP_CONFIG_ALERT_POLARITY
+        self.i2c.regwr(self.addr, self.MCP_CONFIG_REG, struct.pack(">H", self._config))
+        self.callback = callback
+        return self
+
+    def check_alert(self):
+        """
+        Read the alert flags and return them: MCP_FLAG_CRIT, MCP_FLAG_UPPER and
+        MCP_FLAG_LOWER, or 0 if there is no alert. The flags live in the ambient
+        temperature register, so this is the same read as get_temperature() and
+        no cheaper; to have both from one read, use get_raw() and decode().
+        The callback, if there is one, is called when an alert is raised
+        """
+        flags = self.i2c.regrd(self.addr, self.MCP_AMBIENT_TEMP_REG, ">H") >> 13
+        if flags != 0 and not self.alert and self.callback is not None: self.callback(flags)
+        self.alert = flags != 0
+        return flags
+
+    def clear_alert(self):
+        """
+        Release the ALERT output in interrupt mode
+        """
+        config = self._config | self.MCP_CONFIG_INT_CLEAR
+        self.i2c.regwr(self.addr, self.MCP_CONFIG_REG, struct.pack(">H", config))
+        self.alert = False
+        return self
 
     def get_temperature(self):
         """
         Read and return the ambient temperature
         """
-        temp = self.i2c.regrd(self.addr, self.MCP_AMBIENT_TEMP_REG, ">H")
-        temp_msb =  (temp & 0xFF00) >> 8
-        temp_lsb = temp & 0xFF
+        return self.decode(self.get_raw())
 
-        temp_msb = temp_msb & 0x1F
-        if temp_msb & 0x10 == 0x10:
-            temp_msb = temp_msb & 0x0F
-            temp = 256 - (temp_msb * 16 + temp_lsb / 16)
-        else:
-            temp = temp_msb * 16 + temp_lsb / 16
+    def get_raw(self):
+        """
+        Read and return the ambient temperature register's value, alert flags included
+        """
+        return self.i2c.regrd(self.addr, self.MCP_AMBIENT_TEMP_REG, ">H")
 
-        return temp
+    @staticmethod
+    def decode(raw):
+        """
+        Convert an ambient temperature register value to degrees Celsius
+        """
+        raw &= 0x1FFF
+        if raw & 0x1000: raw -= 0x2000
+        return raw / 16
+
+    def read_burst(self, count):
+        """
+        Take 'count' readings, one per conversion at the current resolution, and
+        return them as an array('f') of temperatures
+        """
+        period = self.MCP_RESOLUTIONS[self.resolution][1]
+        timer = FrameScheduler(drop=False, period=period)
+        data = bytearray()
+        for i in timer.run(range(0, count)):
+            data += self.i2c.regrd(self.addr, self.MCP_AMBIENT_TEMP_REG, 2)
+
+        # Decode the big-endian, 13-bit two's complement readings in one pass
+        raw = array("H", bytes(data))
+        if sys.byteorder == "little": raw.byteswap()
+        return array("f", [(((r & 0x1FFF) ^ 0x1000) - 0x1000) * 0.0625 for r in raw])
+
+    def samples(self, rate=4.0, count=None):
+        """
+        Yield the temperature 'rate' times a second, or as often as the current
+        resolution's conversion time allows, forever or for 'count' readings
+        """
+        period = max(1.0 / rate, self.MCP_RESOLUTIONS[self.resolution][1])
+        timer = FrameScheduler(period=period)
+        for i in timer.run(itertools.count() if count is None else range(0, count)):
+            yield self.get_temperature()
 
     def get_ids(self):
         """
@@ -54,15 +165,24 @@ class MCP9808:
 
 
 if __name__ == '__main__':
-    i2c_bus = i2cdriver.I2CDriver("/dev/cu.usbserial-DO029IEZ")
+    # Set I2C_STATS=text or I2C_STATS=json to report bus usage
+    i2c_bus = i2cstats.from_env(i2cdriver.I2CDriver("/dev/cu.usbserial-DO029IEZ"))
     sensor = MCP9808(i2c_bus)
 
     # Check that we can read the manufacturer ID
     manufacturer, device = sensor.get_ids()
     assert manufacturer == 0x54
 
-    # Loop and display temperature every 5 seconds
+    # Read the sensor every 5 seconds, but only display the temperature when it
+    # has moved more than a degree either way. The alert flags come free with
+    # each reading, in the same register, so this costs no extra bus traffic
+    reading = sensor.get_temperature()
+    print(f"Temperature: {reading:.2f}ºC")
+    sensor.set_alert(reading - 1.0, reading + 1.0)
     while True:
-        reading = sensor.get_temperature()
-        print(f"Temperature: {reading:.2f}ºC")
         time.sleep(5.0)
+        raw = sensor.get_raw()
+        if raw >> 13 == 0: continue
+        reading = sensor.decode(raw)
+        print(f"Temperature: {reading:.2f}ºC")
+        sensor.set_alert(reading - 1.0, reading + 1.0)
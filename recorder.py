@@ -0,0 +1,243 @@
+"""
+Bus traffic recording and replay for the I2CDriver Mini (https://i2cdriver.com/mini.html)
+
+Usage: python3 recorder.py LOG [LOG ...] [--replay] [--realtime]
+"""
+
+import time
+import struct
+import argparse
+from collections import Counter
+from fakebus import FakeI2CDriver
+
+MAGIC = b"I2CR\x01"
+
+# Each record is a header followed by 'length' payload bytes:
+#   seconds since recording began, op, device address, argument, length
+# The argument is the read/write bit for START and the register for REGRD and
+# REGWR. Bit 7 of the op is set if the device acknowledged
+ACK = 0x80
+RECORD = struct.Struct("<dBBBH")
+
+OP_START = 1
+OP_WRITE = 2
+OP_READ = 3
+OP_STOP = 4
+OP_REGRD = 5
+OP_REGWR = 6
+OP_SCAN = 7
+
+OP_NAMES = {OP_START: "start", OP_WRITE: "write", OP_READ: "read", OP_STOP: "stop",
+            OP_REGRD: "regrd", OP_REGWR: "regwr", OP_SCAN: "scan"}
+
+
+class ReplayError(IOError):
+    """
+    Raised when a driver's calls no longer match the recording being replayed
+    """
+    pass
+
+
+class Recorder:
+    """
+    A wrapper for an I2CDriver, or any object with the same methods, that can be
+    passed to any of the drivers in place of the bus itself. Every call is passed
+    on and logged, with its time and payload, to a compact binary file
+    """
+
+    def __init__(self, i2c, path):
+        self.i2c = i2c
+        self.records = 0
+        self._file = open(path, "wb")
+        self._file.write(MAGIC)
+        self._begun = time.monotonic()
+        self._dev = 0
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def start(self, dev, rw):
+        ack = self.i2c.start(dev, rw)
+        self._dev = dev
+        self._log(OP_START, dev, rw, ack=ack)
+        return ack
+
+    def write(self, bb):
+        ack = self.i2c.write(bb)
+        # Copy the payload: drivers write from buffers they go on to change
+        self._log(OP_WRITE, self._dev, 0, bytes(bb), ack)
+        return ack
+
+    def read(self, l):
+        data = self.i2c.read(l)
+        self._log(OP_READ, self._dev, 0, data)
+        return data
+
+    def stop(self):
+        self.i2c.stop()
+        self._log(OP_STOP, self._dev, 0)
+
+    def regrd(self, dev, reg, fmt="B"):
+        size = struct.calcsize(fmt) if isinstance(fmt, str) else fmt
+        data = self.i2c.regrd(dev, reg, size)
+        self._log(OP_REGRD, dev, reg, data)
+        if isinstance(fmt, str):
+            r = struct.unpack(fmt, data)
+            return r[0] if len(r) == 1 else r
+        return data
+
+    def regwr(self, dev, reg, vv):
+        ack = self.i2c.regwr(dev, reg, vv)
+        data = struct.pack("B", vv) if isinstance(vv, int) else bytes(vv)
+        self._log(OP_REGWR, dev, reg, data, ack)
+        return ack
+
+    def scan(self, silent=False):
+        found = self.i2c.scan(silent)
+        self._log(OP_SCAN, 0, 0, bytes(found))
+        return found
+
+    def __getattr__(self, name):
+        return getattr(self.i2c, name)
+
+    def _log(self, op, dev, arg, payload=b"", ack=True):
+        if ack: op |= ACK
+        self._file.write(RECORD.pack(time.monotonic() - self._begun, op, dev, arg, len(payload)))
+        if len(payload) > 0: self._file.write(payload)
+        self.records += 1
+
+
+def read_log(path):
+    """
+    Yield each record in a log as a tuple: (time, op, device address, argument,
+    acknowledged, payload)
+    """
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC: raise ValueError(f"{path} is not a bus recording")
+        while True:
+            header = f.read(RECORD.size)
+            if len(header) < RECORD.size: return
+            stamp, op, dev, arg, length = RECORD.unpack(header)
+            payload = f.read(length) if length > 0 else b""
+            yield (stamp, op & 0x7F, dev, arg, op & ACK != 0, payload)
+
+
+def summarise(path):
+    """
+    Return the number of calls of each kind, the bytes written and read for each
+    device, and the recording's duration
+    """
+    calls = Counter()
+    written = Counter()
+    read = Counter()
+    duration = 0.0
+    for stamp, op, dev, arg, ack, payload in read_log(path):
+        calls[OP_NAMES[op]] += 1
+        if op in (OP_WRITE, OP_REGWR): written[dev] += len(payload)
+        if op in (OP_READ, OP_REGRD): read[dev] += len(payload)
+        duration = stamp
+    return {"calls": dict(calls),
+            "written": {f"0x{dev:02X}": n for dev, n in sorted(written.items())},
+            "read": {f"0x{dev:02X}": n for dev, n in sorted(read.items())},
+            "duration": duration}
+
+
+def replay(path, i2c, realtime=False):
+    """
+    Send a recording's calls to a bus (an I2CDriver or a fakebus.FakeI2CDriver),
+    either as fast as possible or, if 'realtime' is True, at the recorded pace.
+    Returns the number of calls made
+    """
+    begun = time.monotonic()
+    count = 0
+    for stamp, op, dev, arg, ack, payload in read_log(path):
+        if realtime:
+            wait = begun + stamp - time.monotonic()
+            if wait > 0: time.sleep(wait)
+        if op == OP_START: i2c.start(dev, arg)
+        elif op == OP_WRITE: i2c.write(payload)
+        elif op == OP_READ: i2c.read(len(payload))
+        elif op == OP_STOP: i2c.stop()
+        elif op == OP_REGRD: i2c.regrd(dev, arg, len(payload))
+        elif op == OP_REGWR: i2c.regwr(dev, arg, payload)
+        elif op == OP_SCAN: i2c.scan(True)
+        count += 1
+    return count
+
+
+class ReplayBus:
+    """
+    Stands in for the bus when a driver is run again without its device: each
+    call is checked against the next one in the recording and answered with the
+    recorded data and acknowledgement. A ReplayError is raised as soon as the
+    driver does something the recording did not
+    """
+
+    def __init__(self, path):
+        self.records = list(read_log(path))
+        self.position = 0
+
+    def start(self, dev, rw):
+        return self._next(OP_START, dev, rw)[4]
+
+    def write(self, bb):
+        record = self._next(OP_WRITE)
+        if record[5] != bytes(bb): raise ReplayError(f"Write {self.position} differs from the recording")
+        return record[4]
+
+    def read(self, l):
+        return self._next(OP_READ)[5]
+
+    def stop(self):
+        self._next(OP_STOP)
+
+    def regrd(self, dev, reg, fmt="B"):
+        data = self._next(OP_REGRD, dev, reg)[5]
+        if isinstance(fmt, str):
+            r = struct.unpack(fmt, data)
+            return r[0] if len(r) == 1 else r
+        return data
+
+    def regwr(self, dev, reg, vv):
+        record = self._next(OP_REGWR, dev, reg)
+        data = struct.pack("B", vv) if isinstance(vv, int) else bytes(vv)
+        if record[5] != data: raise ReplayError(f"Write {self.position} differs from the recording")
+        return record[4]
+
+    def scan(self, silent=False):
+        return list(self._next(OP_SCAN)[5])
+
+    def _next(self, op, dev=None, arg=None):
+        if self.position >= len(self.records):
+            raise ReplayError(f"{OP_NAMES[op]} called after the end of the recording")
+        record = self.records[self.position]
+        self.position += 1
+        if record[1] != op or (dev is not None and record[2] != dev) or (arg is not None and record[3] != arg):
+            raise ReplayError(f"Call {self.position} is {OP_NAMES[op]}, but the recording has {OP_NAMES[record[1]]}")
+        return record
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Summarise or replay I2C bus recordings")
+    parser.add_argument("logs", nargs="+", help="recordings made with recorder.Recorder")
+    parser.add_argument("--replay", action="store_true",
+                        help="replay each recording on a simulated bus and report its bus time")
+    parser.add_argument("--realtime", action="store_true", help="replay at the recorded pace")
+    args = parser.parse_args()
+
+    for log in args.logs:
+        summary = summarise(log)
+        calls = ", ".join([f"{name} {n}" for name, n in sorted(summary["calls"].items())])
+        print(f"{log}: {summary['duration']:.3f}s, {calls}")
+        for dev, n in summary["written"].items(): print(f"    {dev}: {n} bytes written")
+        for dev, n in summary["read"].items(): print(f"    {dev}: {n} bytes read")
+        if args.replay:
+            fake = FakeI2CDriver()
+            count = replay(log, fake, args.realtime)
+            print(f"    replayed {count} calls: {fake.elapsed * 1000:.1f}ms simulated bus time")
@@ -0,0 +1,124 @@
+"""
+Background display refresh for the I2CDriver Mini (https://i2cdriver.com/mini.html)
+HT16K33 drivers
+"""
+
+import time
+import threading
+
+
+class RefreshWorker:
+    """
+    Pushes frames to an HT16K33 display (matrix or 7-segment) from a background
+    thread, so drawing does not wait on the bus. The application keeps drawing
+    with the driver's usual methods, which write into the driver's buffer (the back
+    buffer), then calls present(). That copies the frame into a spare buffer and
+    atomically swaps it with the pending one; the worker swaps the newest pending
+    frame to the front and sends it, at no more than 'fps' frames per second.
+    Frames superseded before the worker gets to them are dropped.
+    'lock' guards the bus: pass the same lock to other code that uses it, eg.
+    sensor polling, or use the worker's own 'lock' attribute. Frames identical
+    to the last one sent are skipped. After stopping the worker, call the driver's
+    update(full=True) before going back to updating it directly. If a bus write
+    fails, the worker stops and the exception is raised again by the next call
+    to present() or stop()
+    """
+
+    def __init__(self, driver, fps=30, lock=None):
+        self.driver = driver
+        self.period = 1.0 / fps
+        self.lock = lock if lock is not None else threading.RLock()
+        self.presented = 0
+        self.sent = 0
+        self.dropped = 0
+        self.error = None
+
+        # Each frame buffer holds the RAM address byte (0x00) ahead of the frame,
+        # so it can be written to the bus as it is
+        size = len(driver.buffer) + 1
+        self._front = bytearray(size)
+        self._pending = bytearray(size)
+        self._spare = bytearray(size)
+        self._last = None
+        self._fresh = False
+        self._swap = threading.Lock()
+        self._wake = threading.Event()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        if self._running: return self
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="RefreshWorker", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop the worker once it has sent any frame still pending
+        """
+        self._running = False
+        self._wake.set()
+        if self._thread is not None: self._thread.join()
+        self._thread = None
+        self._raise_error()
+
+    def present(self):
+        """
+        Queue the driver's current buffer as the next frame to show
+        """
+        self._raise_error()
+        self._spare[1:] = self.driver.buffer
+        with self._swap:
+            if self._fresh: self.dropped += 1
+            self._pending, self._spare = self._spare, self._pending
+            self._fresh = True
+        self.presented += 1
+        self._wake.set()
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def _raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def _run(self):
+        try:
+            self._send_frames()
+        except Exception as err:
+            self.error = err
+            self._running = False
+
+    def _send_frames(self):
+        deadline = time.monotonic()
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            with self._swap:
+                fresh = self._fresh
+                if fresh:
+                    self._front, self._pending = self._pending, self._front
+                    self._fresh = False
+            if fresh and self._front != self._last:
+                with self.lock:
+                    self.driver.i2c.start(self.driver.addr, 0)
+                    self.driver.i2c.write(self._front)
+                    self.driver.i2c.stop()
+                if self._last is None:
+                    self._last = bytearray(self._front)
+                else:
+                    self._last[:] = self._front
+                self.sent += 1
+            elif not fresh and not self._running:
+                return
+
+            # Hold off until the next frame slot, picking up only the newest frame
+            deadline = max(deadline + self.period, time.monotonic())
+            time.sleep(max(deadline - time.monotonic(), 0))
+            if not self._running: self._wake.set()
@@ -0,0 +1,151 @@
+"""
+Device discovery for the I2CDriver Mini (https://i2cdriver.com/mini.html): scan the
+bus once, identify the parts on it and remember them for next time
+"""
+
+import os
+import json
+import time
+import i2cdriver
+import i2cstats
+from matrix import HT16K33 as MatrixLED
+from counter import HT16K33 as SegmentLED
+from mcp9808 import MCP9808
+from tsl2561 import TSL2561
+
+CACHE_PATH = os.path.expanduser("~/.i2cdriver-devices.json")
+
+
+def probe_mcp9808(i2c, address):
+    manufacturer, device = MCP9808(i2c, address).get_ids()
+    return manufacturer == 0x0054 and (device >> 8) == 0x04
+
+
+def probe_tsl2561(i2c, address):
+    # Read the ID register without powering the part up: TSL2560 and TSL2561
+    # part numbers, in CS and T/FN/CL packages
+    part = i2c.regrd(address, TSL2561.TSL_CMD_FLAG | TSL2561.TSL_ID_REG, "B")
+    return (part >> 4) in (0x0, 0x1, 0x4, 0x5)
+
+
+def probe_ack(i2c, address):
+    # For parts with no ID register: just check that something answers
+    present = i2c.start(address, 0)
+    i2c.stop()
+    return present
+
+
+# Each known part: the addresses it can be strapped to and how to recognise it
+PARTS = {
+    "MCP9808": (range(0x18, 0x20), probe_mcp9808),
+    "TSL2561": ((0x29, 0x39, 0x49), probe_tsl2561),
+    "HT16K33": (range(0x70, 0x78), probe_ack),
+}
+
+
+class DeviceRegistry:
+    """
+    Finds and identifies the known parts on an I2CDriver's bus, and caches the
+    result in a JSON file keyed by the adapter's serial number. On later runs
+    with the same adapter, only the cached devices are checked, and the bus is
+    scanned again only if one of them has gone. The HT16K33 has no ID register,
+    so whether it drives a matrix or a segment display has to be given
+    """
+
+    def __init__(self, i2c, path=CACHE_PATH):
+        self.i2c = i2c
+        self.path = path
+        self.serial = getattr(i2c, "serial", None)
+        self.devices = {}
+        self.scanned = False
+
+    def discover(self):
+        """
+        Return a dictionary of found parts' names keyed by address, using the
+        cache if it is still valid. An empty result is never cached, so a bus
+        with nothing found on it is scanned again next time
+        """
+        cached = self._load().get(self.serial) if self.serial is not None else None
+        if cached:
+            devices = {int(addr, 16): part for addr, part in cached.items()}
+            if all([self._identify(addr, [part]) == part for addr, part in devices.items()]):
+                self.devices = devices
+                self.scanned = False
+                return self.devices
+
+        self.devices = {}
+        for addr in self.i2c.scan(True):
+            part = self._identify(addr, PARTS.keys())
+            if part is not None: self.devices[addr] = part
+        self.scanned = True
+        if self.serial is not None:
+            if len(self.devices) > 0:
+                self._save()
+            else:
+                self.forget()
+        return self.devices
+
+    def get(self, part, index=0, display=SegmentLED):
+        """
+        Return a driver for the index-th (by address) instance of the named part,
+        or None. 'display' is the driver class to use for an HT16K33
+        """
+        if len(self.devices) == 0: self.discover()
+        found = sorted([addr for addr, name in self.devices.items() if name == part])
+        if index >= len(found): return None
+        if part == "MCP9808": return MCP9808(self.i2c, found[index])
+        if part == "TSL2561": return TSL2561(self.i2c, found[index])
+        if part == "HT16K33": return display(self.i2c, found[index])
+        return None
+
+    def forget(self):
+        """
+        Remove this adapter's entry from the cache
+        """
+        cache = self._load()
+        if cache.pop(self.serial, None) is not None: self._write(cache)
+
+    def _identify(self, address, parts):
+        for part in parts:
+            addresses, probe = PARTS[part]
+            if address not in addresses: continue
+            try:
+                if probe(self.i2c, address): return part
+            except (IOError, i2cdriver.I2CTimeout):
+                pass
+        return None
+
+    def _load(self):
+        try:
+            with open(self.path) as f: return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        cache = self._load()
+        cache[self.serial] = {f"0x{addr:02X}": part for addr, part in sorted(self.devices.items())}
+        self._write(cache)
+
+    def _write(self, cache):
+        # Write a temporary file and rename it, so a reader never sees half a file
+        temp = self.path + ".tmp"
+        with open(temp, "w") as f: json.dump(cache, f, indent=2, sort_keys=True)
+        os.replace(temp, self.path)
+
+
+if __name__ == '__main__':
+    # Set I2C_STATS=text or I2C_STATS=json to report bus usage
+    i2c_bus = i2cstats.from_env(i2cdriver.I2CDriver("/dev/cu.usbserial-DO029IEZ"))
+    registry = DeviceRegistry(i2c_bus)
+    begun = time.monotonic()
+    found = registry.discover()
+    source = "bus scan" if registry.scanned else "cache"
+    print(f"Found {len(found)} device(s) on adapter {registry.serial} from {source} in {time.monotonic() - begun:.3f}s")
+    for address, name in sorted(found.items()): print(f"0x{address:02X}: {name}")
+
+    sensor = registry.get("MCP9808")
+    if sensor is not None: print(f"Temperature: {sensor.get_temperature():.2f}ºC")
+    light = registry.get("TSL2561")
+    if light is not None: print(f"Light: {light.get_lux()} lux")
+    led = registry.get("HT16K33", display=MatrixLED)
+    if led is not None: led.scroll_text("Hello")
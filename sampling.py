@@ -0,0 +1,126 @@
+"""
+Streaming statistics for the I2CDriver Mini (https://i2cdriver.com/mini.html) sensor
+drivers' samples() generators
+"""
+
+import time
+from array import array
+from collections import deque
+import i2cdriver
+import i2cstats
+from mcp9808 import MCP9808
+
+
+class Window:
+    """
+    Statistics over the last 'size' samples, updated in constant (amortised) time
+    per sample: mean, minimum, maximum, an exponential moving average and whether
+    the latest sample differs from the previous average by more than 'threshold'.
+    The samples are kept in a fixed-size array; the minimum and maximum come from
+    monotonic queues of the samples that could still become either
+    """
+
+    def __init__(self, size, alpha=None, threshold=None):
+        """
+        'alpha' is the EMA's smoothing factor, by default 2 / (size + 1)
+        """
+        self.size = size
+        self.alpha = alpha if alpha is not None else 2.0 / (size + 1)
+        self.threshold = threshold
+        self.values = array("d", bytes(8 * size))
+        self.count = 0
+        self.ema = None
+        self.changed = False
+        self._total = 0.0
+        self._lows = deque()
+        self._highs = deque()
+
+    def add(self, value):
+        n = self.count
+        slot = n % self.size
+        if n >= self.size: self._total -= self.values[slot]
+        self.values[slot] = value
+        self._total += value
+        self.count = n + 1
+
+        # Recompute the total once per lap, so rounding errors cannot build up
+        if slot == self.size - 1: self._total = sum(self.values)
+
+        oldest = n - self.size
+        while len(self._lows) > 0 and self._lows[-1][1] >= value: self._lows.pop()
+        self._lows.append((n, value))
+        if self._lows[0][0] <= oldest: self._lows.popleft()
+        while len(self._highs) > 0 and self._highs[-1][1] <= value: self._highs.pop()
+        self._highs.append((n, value))
+        if self._highs[0][0] <= oldest: self._highs.popleft()
+
+        if self.ema is None:
+            self.ema = value
+            self.changed = False
+        else:
+            self.changed = self.threshold is not None and abs(value - self.ema) > self.threshold
+            self.ema += self.alpha * (value - self.ema)
+        return self
+
+    @property
+    def full(self):
+        return self.count >= self.size
+
+    @property
+    def mean(self):
+        if self.count == 0: return None
+        return self._total / min(self.count, self.size)
+
+    @property
+    def minimum(self):
+        return self._lows[0][1] if self.count > 0 else None
+
+    @property
+    def maximum(self):
+        return self._highs[0][1] if self.count > 0 else None
+
+
+def windowed(samples, size, alpha=None, threshold=None):
+    """
+    Yield a (sample, Window) tuple for each sample; the same Window is updated
+    each time. Samples of None, eg. saturated light levels, are skipped
+    """
+    window = Window(size, alpha, threshold)
+    for value in samples:
+        if value is None: continue
+        yield (value, window.add(value))
+
+
+def downsample(samples, n):
+    """
+    Yield the mean, minimum and maximum of each run of 'n' samples as a tuple,
+    without keeping the samples. Samples of None are skipped
+    """
+    total = 0.0
+    count = 0
+    low = high = None
+    for value in samples:
+        if value is None: continue
+        total += value
+        if count == 0 or value < low: low = value
+        if count == 0 or value > high: high = value
+        count += 1
+        if count == n:
+            yield (total / n, low, high)
+            total = 0.0
+            count = 0
+
+
+if __name__ == '__main__':
+    # Set I2C_STATS=text or I2C_STATS=json to report bus usage
+    i2c_bus = i2cstats.from_env(i2cdriver.I2CDriver("/dev/cu.usbserial-DO029IEZ"))
+    sensor = MCP9808(i2c_bus)
+    sensor.set_resolution(1)
+
+    # Sample at 10Hz, but only report one-second averages, plus a minute's trend
+    trend = Window(60, threshold=0.5)
+    for mean, low, high in downsample(sensor.samples(rate=10), 10):
+        trend.add(mean)
+        note = " (changed)" if trend.changed else ""
+        print(f"{time.strftime('%H:%M:%S')} {mean:.2f}ºC ({low:.2f}-{high:.2f}), "
+              f"last minute {trend.minimum:.2f}-{trend.maximum:.2f}, EMA {trend.ema:.2f}{note}")
@@ -0,0 +1,98 @@
+"""
+Drift-free frame pacing for the I2CDriver Mini (https://i2cdriver.com/mini.html) display demos
+"""
+
+import time
+import itertools
+
+
+class FrameScheduler:
+    """
+    Paces an animation against monotonic-clock deadlines. The time spent drawing
+    a frame and writing it to the bus is taken off the wait for the next one, so
+    the frame period does not drift. When a frame overruns, the frames whose
+    deadlines have already passed are dropped; if 'drop' is False, the schedule
+    slips instead and every frame is shown
+    """
+
+    def __init__(self, fps=30, drop=True, period=None):
+        """
+        Set the target rate, either in frames per second or as a period in seconds
+        """
+        if period is None: period = 1.0 / fps if fps > 0 else 0.0
+        self.period = period
+        self.drop = drop
+        self.reset()
+
+    def reset(self):
+        """
+        Zero the timing statistics
+        """
+        self.frames = 0
+        self.dropped = 0
+        self.missed = 0
+        self.busy = 0.0
+        self._first = None
+        self._last = None
+        self._expected = self.period
+        self._jitter_sq = 0.0
+
+    def run(self, source):
+        """
+        Yield each item of 'source' at its deadline. The caller draws and updates
+        the display in the loop body
+        """
+        period = self.period
+        items = iter(source)
+        deadline = time.monotonic()
+        for item in items:
+            begun = time.monotonic()
+            self._record(begun)
+            yield item
+
+            now = time.monotonic()
+            self.busy += now - begun
+            deadline += period
+            self._expected = period
+            if period > 0 and now > deadline:
+                self.missed += 1
+                if self.drop is True:
+                    # Skip the frames whose slots have gone completely;
+                    # the next one is shown straight away
+                    late = int((now - deadline) / period)
+                    skipped = sum(1 for i in itertools.islice(items, late))
+                    self.dropped += skipped
+                    deadline += skipped * period
+                    self._expected += skipped * period
+                else:
+                    deadline = now
+            if deadline > now: time.sleep(deadline - now)
+
+    def stats(self):
+        """
+        Return the achieved frame rate, RMS jitter (seconds), the average time spent
+        in each frame and counts of the frames shown, dropped and late
+        """
+        fps = 0.0
+        jitter = 0.0
+        if self.frames > 1:
+            fps = (self.frames - 1) / (self._last - self._first)
+            jitter = (self._jitter_sq / (self.frames - 1)) ** 0.5
+        return {"fps": fps,
+                "jitter": jitter,
+                "busy": self.busy / self.frames if self.frames > 0 else 0.0,
+                "frames": self.frames,
+                "dropped": self.dropped,
+                "missed": self.missed}
+
+    def _record(self, now):
+        """
+        Note the start of a frame and how far it is from where it should be
+        """
+        if self._first is None:
+            self._first = now
+        else:
+            error = (now - self._last) - self._expected
+            self._jitter_sq += error * error
+        self._last = now
+        self.frames += 1
@@ -0,0 +1,176 @@
+"""
+Long-running sensor telemetry for the I2CDriver Mini (https://i2cdriver.com/mini.html):
+a fixed-size, memory-mapped ring of binary sample records
+
+Usage: python3 telemetry.py LOG [SECONDS]
+"""
+
+import os
+import sys
+import time
+import mmap
+import struct
+import i2cdriver
+import i2cstats
+from mcp9808 import MCP9808
+from tsl2561 import TSL2561
+
+MAGIC = b"I2CT"
+VERSION = 1
+
+# The file header: magic, version, record size, number of record slots and the
+# number of records ever written, padded so the records start 32 bytes in
+HEADER = struct.Struct("<4sHHQQ")
+HEADER_SIZE = 32
+COUNT_OFFSET = 16
+
+# Each record: time (seconds since the epoch), device address, raw value, decoded value
+RECORD = struct.Struct("<dB3xId")
+
+
+class RingLog:
+    """
+    Appends fixed-size sample records to a preallocated, memory-mapped file that
+    wraps round once it is full, so the newest 'capacity' samples are kept.
+    Writing a sample is a copy into the map: no system call and no allocation.
+    Any number of readers may open the same file, read-only, while it is being
+    written. Records are written before the count that makes them visible, and a
+    reader discards any it read that the writer may have overwritten meanwhile.
+    The file has one slot more than 'capacity', for the record being written
+    """
+
+    def __init__(self, path, capacity=1000000, readonly=False):
+        """
+        Open a ring file, creating it with room for 'capacity' records if it does
+        not exist. An existing file keeps its own capacity
+        """
+        self.path = path
+        self.readonly = readonly
+        if not readonly and not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.truncate(HEADER_SIZE + (capacity + 1) * RECORD.size)
+                f.write(HEADER.pack(MAGIC, VERSION, RECORD.size, capacity + 1, 0))
+
+        self._file = open(path, "rb" if readonly else "r+b")
+        access = mmap.ACCESS_READ if readonly else mmap.ACCESS_WRITE
+        self._map = mmap.mmap(self._file.fileno(), 0, access=access)
+        magic, version, size, self._slots, count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION or size != RECORD.size:
+            self.close()
+            raise ValueError(f"{path} is not a telemetry ring")
+        self.capacity = self._slots - 1
+        self._count = count
+
+    def close(self):
+        if not self._map.closed:
+            if not self.readonly: self._map.flush()
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def append(self, address, raw, value, stamp=None):
+        """
+        Add a sample, timestamped now unless 'stamp' is given
+        """
+        if stamp is None: stamp = time.time()
+        count = self._count
+        RECORD.pack_into(self._map, HEADER_SIZE + (count % self._slots) * RECORD.size,
+                         stamp, address, raw, value)
+        self._count = count + 1
+        struct.pack_into("<Q", self._map, COUNT_OFFSET, self._count)
+
+    def flush(self):
+        """
+        Ask the OS to write the samples out to disk now
+        """
+        self._map.flush()
+
+    @property
+    def count(self):
+        """
+        The number of samples ever written, including those overwritten since
+        """
+        return struct.unpack_from("<Q", self._map, COUNT_OFFSET)[0]
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def records(self, first, last=None):
+        """
+        Return a list of the records with sequence numbers first to last - 1 (all
+        those written since 'first' if last is None) that are still in the ring,
+        each as a tuple: (time, address, raw, decoded)
+        """
+        count = self.count
+        if last is None or last > count: last = count
+        first = max(first, count - self.capacity)
+        result = [RECORD.unpack_from(self._map, self._offset(n)) for n in range(first, last)]
+
+        # Drop any records the writer got round to while we were reading them
+        overwritten = self.count - self.capacity - first
+        return result[overwritten:] if overwritten > 0 else result
+
+    def latest(self, n=1):
+        """
+        Return the newest 'n' records
+        """
+        count = self.count
+        return self.records(count - n, count)
+
+    def between(self, start, end):
+        """
+        Return the records timestamped from 'start' up to (not including) 'end',
+        found by binary search so only the records in range are read
+        """
+        count = self.count
+        oldest = max(0, count - self.capacity)
+        return self.records(self._search(start, oldest, count), self._search(end, oldest, count))
+
+    def _offset(self, n):
+        return HEADER_SIZE + (n % self._slots) * RECORD.size
+
+    def _search(self, stamp, low, high):
+        # The first sequence number whose record is timestamped at or after 'stamp'
+        while low < high:
+            middle = (low + high) // 2
+            if struct.unpack_from("<d", self._map, self._offset(middle))[0] < stamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__.strip().splitlines()[-1])
+        sys.exit(1)
+    period = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+
+    # Set I2C_STATS=text or I2C_STATS=json to report bus usage
+    i2c_bus = i2cstats.from_env(i2cdriver.I2CDriver("/dev/cu.usbserial-DO029IEZ"))
+    sensor = MCP9808(i2c_bus)
+    light = TSL2561(i2c_bus)
+
+    with RingLog(sys.argv[1]) as log:
+        reported = time.time()
+        while True:
+            raw = sensor.get_raw()
+            log.append(sensor.addr, raw, sensor.decode(raw))
+            adc_0, adc_1 = light.get_light_level()
+            lux = light.calculate_lux(adc_0, adc_1)
+            log.append(light.addr, adc_0 | (adc_1 << 16), lux if lux is not None else float("nan"))
+
+            # Summarise the last minute every minute
+            now = time.time()
+            if now - reported >= 60:
+                temps = [r[3] for r in log.between(now - 60, now) if r[1] == sensor.addr]
+                if len(temps) > 0:
+                    print(f"{len(temps)} readings, mean {sum(temps) / len(temps):.2f}ºC, "
+                          f"{len(log)} of {log.capacity} samples held")
+                reported = now
+            time.sleep(period)
@@ -4,7 +4,12 @@ and a TSL2561 digital temperature sensor
 """
 
 import time
+import struct
+import itertools
 import i2cdriver
+import i2cstats
+from i2cbatch import BatchedI2C
+from scheduler import FrameScheduler
 
 
 class TSL2561:
@@ -13,13 +18,28 @@ class TSL2561:
     """
 
     TSL_CMD_FLAG = 0x80
+    TSL_CLEAR_FLAG = 0x40
     TSL_CTRL_REG = 0x00
     TSL_TIMING_REG = 0x01
+    TSL_THRESH_LOW_REG = 0x02
+    TSL_THRESH_HIGH_REG = 0x04
+    TSL_INT_REG = 0x06
     TSL_ID_REG = 0x0A
     TSL_ADC_0 = 0x0C
     TSL_ADC_1 = 0x0E
 
-    def __init__(self, i2c, address=0x39):
+    # Gain and integration time settings, from the most light to the least light
+    # they can measure: (timing register value, integration time in seconds,
+    # saturation count, multiplier that scales counts to 402ms at 16x gain)
+    TSL_RANGES = [(0x00, 0.0137, 5047, 322 / 11 * 16),
+                  (0x10, 0.0137, 5047, 322 / 11),
+                  (0x11, 0.101, 37177, 322 / 81),
+                  (0x12, 0.402, 65535, 1.0)]
+
+    # Below this many broadband counts a reading has too little resolution
+    TSL_MIN_COUNTS = 100
+
+    def __init__(self, i2c, address=0x39, auto_range=True):
         """
         Instantiate the TSL2561 class
         Takes an I2CDriver instance and an (optional) I2C address
@@ -28,62 +48,177 @@ class TSL2561:
         self.i2c = i2c
         self.addr = address
         self.alert = False
+        self.auto_range = auto_range
+        self.range = 2
+        self.callback = None
+        self._thresholds = None
 
         # Power up device
         cmd = self.make_command(self.TSL_CTRL_REG)
-        self.i2c.regwr(self.addr, self.TSL_CTRL_REG, [0x03])
+        self.i2c.regwr(self.addr, cmd, [0x03])
+
+        # Set timing: 16x gain, 101ms integration
+        self.set_range(self.range)
 
-        # Set timing
+    def set_range(self, index):
+        """
+        Select one of the TSL_RANGES gain and integration time settings
+        """
+        if not 0 <= index < len(self.TSL_RANGES): return None
+        self.range = index
         cmd = self.make_command(self.TSL_TIMING_REG)
-        self.i2c.regwr(self.addr, cmd, [0x11])
+        self.i2c.regwr(self.addr, cmd, [self.TSL_RANGES[index][0]])
+        return self
 
     def get_light_level(self):
         """
-        Read and return the ambient temperature
+        Read and return the raw broadband (ADC0) and infrared (ADC1) counts as a tuple.
+        Both channels are read in one transaction
         """
         cmd = self.make_command(self.TSL_ADC_0)
-        adc_0 = self.i2c.regrd(self.addr, cmd, ">H")
-        adc_0_msb =  (adc_0 & 0xFF00) >> 8
-        adc_0_lsb = adc_0 & 0xFF
+        return self.i2c.regrd(self.addr, cmd, "<HH")
 
-        cmd = self.make_command(self.TSL_ADC_1)
-        adc_1 = self.i2c.regrd(self.addr, cmd, ">H")
-        adc_1_msb =  (adc_1 & 0xFF00) >> 8
-        adc_1_lsb = adc_1 & 0xFF
+    def get_lux(self):
+        """
+        Read and return the illuminance in lux, or None if the sensor is saturated.
+        With auto-ranging on, the gain and integration time are stepped until the
+        counts are neither saturated nor too small to resolve, using the shortest
+        integration time that gives a valid reading. No range is tried twice in one
+        call, so noise at a boundary cannot keep it stepping back and forth
+        """
+        tried = {self.range}
+        while True:
+            adc_0, adc_1 = self.get_light_level()
+            step = self._get_range_step(adc_0, adc_1) if self.auto_range else 0
+            if step == 0 or self.range + step in tried: break
+            self.set_range(self.range + step)
+            tried.add(self.range)
+
+            # Wait for a whole conversion at the new setting
+            time.sleep(self.TSL_RANGES[self.range][1] * 1.2)
+        return self.calculate_lux(adc_0, adc_1)
+
+    def samples(self, rate=4.0, count=None):
+        """
+        Yield the illuminance in lux (see get_lux()) 'rate' times a second, or
+        as often as the current integration time allows, forever or for 'count'
+        readings
+        """
+        period = max(1.0 / rate, self.TSL_RANGES[self.range][1])
+        timer = FrameScheduler(period=period)
+        for i in timer.run(itertools.count() if count is None else range(0, count)):
+            yield self.get_lux()
 
-        return (adc_0, adc_1)
+    def calculate_lux(self, adc_0, adc_1):
+        """
+        Convert channel counts taken at the current range to lux, using the
+        datasheet's empirical formula for the T, FN and CL packages
+        """
+        timing, period, ceiling, scale = self.TSL_RANGES[self.range]
+        if adc_0 >= ceiling or adc_1 >= ceiling: return None
+        if adc_0 == 0: return 0.0
+        ch_0 = adc_0 * scale
+        ch_1 = adc_1 * scale
+        ratio = ch_1 / ch_0
+        if ratio <= 0.5: return 0.0304 * ch_0 - 0.062 * ch_0 * (ratio ** 1.4)
+        if ratio <= 0.61: return 0.0224 * ch_0 - 0.031 * ch_1
+        if ratio <= 0.8: return 0.0128 * ch_0 - 0.0153 * ch_1
+        if ratio <= 1.3: return 0.00146 * ch_0 - 0.00112 * ch_1
+        return 0.0
+
+    def set_alert(self, lower, upper, persist=1, callback=None):
+        """
+        Program the sensor's interrupt thresholds, in broadband (ADC0) counts at
+        the current range, and enable its level interrupt. INT is asserted when
+        the count stays outside lower..upper for 'persist' integration cycles
+        (0 asserts it after every cycle) and holds until clear_alert() is called.
+        'callback' is called with the broadband count whenever an alert is raised.
+        Auto-ranging is turned off, as it would change what the counts mean
+        """
+        self.auto_range = False
+        self.i2c.regwr(self.addr, self.make_command(self.TSL_THRESH_LOW_REG), struct.pack("<H", lower))
+        self.i2c.regwr(self.addr, self.make_command(self.TSL_THRESH_HIGH_REG), struct.pack("<H", upper))
+        self.i2c.regwr(self.addr, self.make_command(self.TSL_INT_REG), [0x10 | (persist & 0x0F)])
+        self._thresholds = (lower, upper)
+        self.callback = callback
+        return self
+
+    def check_alert(self):
+        """
+        Check the broadband count against the thresholds with a single two-byte
+        read and return True if it is outside them. The TSL2561 has no readable
+        interrupt status, and the I2CDriver Mini cannot see the INT pin, so this
+        makes the same comparison the sensor does. The callback, if there is one,
+        is called when an alert is raised
+        """
+        if self._thresholds is None: return False
+        adc_0 = self.i2c.regrd(self.addr, self.make_command(self.TSL_ADC_0), "<H")
+        alerted = not (self._thresholds[0] <= adc_0 <= self._thresholds[1])
+        if alerted and not self.alert and self.callback is not None: self.callback(adc_0)
+        self.alert = alerted
+        return alerted
+
+    def clear_alert(self):
+        """
+        Release the INT output
+        """
+        self.i2c.start(self.addr, 0)
+        self.i2c.write([self.TSL_CMD_FLAG | self.TSL_CLEAR_FLAG | self.TSL_INT_REG])
+        self.i2c.stop()
+        self.alert = False
+        return self
 
     def get_id(self):
         """
         Read and return the manufacturer and device IDs as a tuple
         """
         cmd = self.make_command(self.TSL_CTRL_REG)
-        print(cmd)
         pwr_val = self.i2c.regrd(self.addr, cmd, ">B")
-        print(pwr_val)
 
         cmd = self.make_command(self.TSL_ID_REG)
-        print(cmd)
         dev_id = self.i2c.regrd(self.addr, cmd, ">B")
-        print(dev_id)
         return (dev_id, pwr_val)
 
     def make_command(self, register):
         return self.TSL_CMD_FLAG | 0x20 | register
 
+    def _get_range_step(self, adc_0, adc_1):
+        """
+        Return -1 to move to a less sensitive range, 1 to move to a more sensitive
+        one, or 0 to stay. Stepping down starts short of saturation, so a step up
+        never lands straight back on it. A valid reading also steps down if the
+        next range has a shorter integration time and would still give at least
+        twice TSL_MIN_COUNTS: the margin keeps a step up from there, when the
+        count comes in under the prediction, from undoing it
+        """
+        timing, period, ceiling, scale = self.TSL_RANGES[self.range]
+        if self.range == 0: return 1 if adc_0 < self.TSL_MIN_COUNTS else 0
+        if max(adc_0, adc_1) >= ceiling * 0.9: return -1
+        if adc_0 < self.TSL_MIN_COUNTS and self.range < len(self.TSL_RANGES) - 1: return 1
+        shorter = self.TSL_RANGES[self.range - 1]
+        if shorter[1] < period and adc_0 * scale / shorter[3] >= self.TSL_MIN_COUNTS * 2: return -1
+        return 0
+
 
 if __name__ == '__main__':
-    i2c_bus = i2cdriver.I2CDriver("/dev/cu.usbserial-DO029IEZ")
-    sensor = TSL2561(i2c_bus)
-    i2c_bus.scan()
+    # Set I2C_STATS=text or I2C_STATS=json to report bus usage
+    i2c_bus = i2cstats.from_env(BatchedI2C(i2cdriver.I2CDriver("/dev/cu.usbserial-DO029IEZ")))
+    with i2c_bus.batch():
+        sensor = TSL2561(i2c_bus)
 
     # Check that we can read the manufacturer ID
     part_num, power_val = sensor.get_id()
     part_num = (part_num & 0xF0) >> 4
     #assert part_num == 0x00
 
-    # Loop and display temperature every 5 seconds
+    # Display the light level, then check every 5 seconds whether the broadband
+    # count has moved by more than a quarter: a two-byte read rather than the
+    # four-byte read and lux calculation of a full sample
     while True:
-        reading = sensor.get_light_level()
-        print(f"Lux: {reading[0]:.4f}")
-        time.sleep(5.0)
+        lux = sensor.get_lux()
+        print("Lux: saturated" if lux is None else f"Lux: {lux:.2f}")
+        count = sensor.get_light_level()[0]
+        sensor.set_alert(count * 3 // 4, min(count * 5 // 4 + 1, 0xFFFF))
+        while not sensor.check_alert(): time.sleep(5.0)
+        sensor.clear_alert()
+        sensor.auto_range = True